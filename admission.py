@@ -0,0 +1,209 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission policies deciding how a solve request is handled."""
+
+import logging
+import threading
+import time
+
+
+class SyncAdmissionPolicy(object):
+    """Decides whether a puzzle image is solved synchronously, in the request
+    that submitted it, or handed to the task queue.
+
+    Small images are admitted while fewer than max_in_flight synchronous
+    solves are running; large images and overflow traffic are queued.
+
+    Attributes:
+        max_image_bytes: Largest image size, in bytes, solved synchronously.
+        max_in_flight: Maximum number of concurrent synchronous solves.
+        in_flight: Number of synchronous solves currently running.
+    """
+
+    def __init__(self, max_image_bytes, max_in_flight):
+        """Initialize the SyncAdmissionPolicy object and attributes."""
+
+        self.max_image_bytes = max_image_bytes
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_admit(self, image_size):
+        """Admit an image of the given size for synchronous solving.
+
+        Args:
+            image_size: The integer size of the image data in bytes.
+
+        Returns:
+            True if the image was admitted; the caller must then call release()
+            when done. False if the image should be queued instead.
+        """
+
+        if image_size > self.max_image_bytes:
+            return False
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """Mark a synchronous solve admitted by try_admit() as finished."""
+
+        with self._lock:
+            self.in_flight -= 1
+
+
+# Decisions of BackpressureController.admit().
+QUEUE = 'queue'
+SYNC = 'sync'
+REJECT = 'reject'
+
+
+class StageTimings(object):
+    """Exponentially weighted moving averages of the time spent in each stage of
+    a solve, e.g. fetching, solving and uploading.  Safe to share between
+    threads.
+
+    Attributes:
+        alpha: Weight of each new measurement.
+    """
+
+    def __init__(self, alpha=0.2):
+        """Initialize the StageTimings object and attributes."""
+
+        self.alpha = alpha
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Record the time taken by one run of a stage."""
+
+        with self._lock:
+            average = self._averages.get(stage)
+            if average is None:
+                self._averages[stage] = seconds
+            else:
+                self._averages[stage] = (
+                        self.alpha * seconds + (1 - self.alpha) * average)
+
+    def averages(self):
+        """Return the average time of each stage, as a dict keyed by stage."""
+
+        with self._lock:
+            return dict(self._averages)
+
+
+class BackpressureController(object):
+    """Decides whether a new solve is queued, by estimating how long it would
+    wait from the depth of the task queue and recent per-stage timings.
+
+    Once the estimated wait passes max_wait_seconds, small images are sent to
+    the synchronous path and other requests are rejected, so that clients fail
+    fast and retry later instead of joining a long backlog.
+
+    Attributes:
+        queue: The taskqueue.Queue solves are added to, or a stand-in with a
+            fetch_statistics() method such as pull_queue.LocalPullQueue.
+        max_wait_seconds: Longest estimated wait for which solves are queued.
+        concurrency: Number of solves run at once by all solver instances.
+        sync_max_image_bytes: Largest image sent to the synchronous path.
+        default_service_seconds: Time assumed for a solve before any timings
+            are known.
+        stats_ttl: How long queue statistics and timings are reused, in
+            seconds.
+    """
+
+    def __init__(self, queue, max_wait_seconds, concurrency,
+                 sync_max_image_bytes, load_timings,
+                 default_service_seconds=2.0, stats_ttl=1.0,
+                 clock=time.time):
+        """Initialize the BackpressureController object and attributes.
+
+        Args:
+            load_timings: Function returning the average time of each stage of
+                a solve, as a dict; e.g. StageTimings.averages.
+            clock: Function returning the current time in seconds.
+        """
+
+        self.queue = queue
+        self.max_wait_seconds = max_wait_seconds
+        self.concurrency = concurrency
+        self.sync_max_image_bytes = sync_max_image_bytes
+        self.default_service_seconds = default_service_seconds
+        self.stats_ttl = stats_ttl
+        self._load_timings = load_timings
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._expires = 0
+        self._queued = 0
+        self._service_seconds = default_service_seconds
+
+    def estimate_wait(self):
+        """Estimate how many seconds a solve queued now would wait to finish."""
+
+        self._refresh()
+        with self._lock:
+            return self._queued * self._service_seconds / self.concurrency
+
+    def admit(self, image_size):
+        """Decide how to handle a new solve.
+
+        Args:
+            image_size: Size of the image data in bytes, or 0 if the image is
+                given by URL.
+
+        Returns:
+            A tuple of the decision, QUEUE, SYNC or REJECT, and the estimated
+            wait in seconds.
+        """
+
+        wait = self.estimate_wait()
+        if wait <= self.max_wait_seconds:
+            with self._lock:
+                # Count the solve until fresh statistics include it.
+                self._queued += 1
+            return QUEUE, wait
+        if image_size and image_size <= self.sync_max_image_bytes:
+            return SYNC, wait
+        return REJECT, wait
+
+    def _refresh(self):
+        """Reload the queue depth and stage timings once they are stale.
+
+        They are loaded outside the lock, by the one request that finds them
+        stale, so other admissions use the previous values meanwhile rather
+        than wait for the RPCs.
+        """
+
+        now = self._clock()
+        with self._lock:
+            if now < self._expires:
+                return
+            self._expires = now + self.stats_ttl
+        try:
+            queued = self.queue.fetch_statistics().tasks
+        except Exception:
+            # Fail open: without statistics, solves are queued as usual.
+            logging.exception("could not fetch queue statistics")
+            queued = 0
+        averages = self._load_timings()
+        if averages:
+            service_seconds = sum(averages.values())
+        else:
+            service_seconds = self.default_service_seconds
+        with self._lock:
+            self._queued = queued
+            self._service_seconds = service_seconds
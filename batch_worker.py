@@ -0,0 +1,362 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves batches of sudoku puzzle images leased from a pull queue."""
+
+import logging
+import Queue
+import threading
+import time
+
+import pipeline
+import pull_queue
+import sudoku_image_parser
+import sudoku_solver
+
+
+BATCH_SIZE = 32
+LEASE_SECONDS = 120
+FETCH_THREADS = 8
+CPU_THREADS = 2
+UPLOAD_THREADS = 8
+STAGE_QUEUE_SIZE = 16
+RETRY_LIMIT = 5
+
+
+class BatchSolveWorker(object):
+    """Leases batches of solve tasks from a pull queue and solves them together.
+
+    The OCR model is trained once per worker, the numbers in all the images of
+    a lease are classified with a single query of the model, and the results of
+    a lease are written together.
+
+    Attributes:
+        queue: A taskqueue.Queue pull queue, or a pull_queue.LocalPullQueue.
+        fetch_image: Function returning the image data at the given URL, or
+            None if it could not be fetched.
+        write_result: Function called with the filename and jpeg data of each
+            result, returning a record of its completion. The jpeg data is None
+            for puzzles that could not be solved.
+        mark_done: Function called with the list of completion records of
+            each lease.
+        batch_size: Maximum number of tasks leased at once.
+        lease_seconds: How long tasks are leased for.
+        budget: The search budget of each puzzle, as a (max_nodes,
+            max_seconds) tuple.
+        retry_limit: Number of times a task that failed is leased again
+            before it is answered with the error image.
+        solver: SudokuSolver shared by all puzzles of this worker.
+    """
+
+    def __init__(self, queue, fetch_image, write_result, mark_done,
+                 batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS,
+                 budget=(None, None), retry_limit=RETRY_LIMIT):
+        """Initialize the BatchSolveWorker object and attributes."""
+
+        self.queue = queue
+        self.fetch_image = fetch_image
+        self.write_result = write_result
+        self.mark_done = mark_done
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.budget = budget
+        self.retry_limit = retry_limit
+        self.solver = sudoku_solver.SudokuSolver(*budget)
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The cv2.KNearest model shared by the parsers of this worker,
+        trained when first used."""
+
+        with self._model_lock:
+            if self._model is None:
+                self._model = sudoku_image_parser.SudokuImageParser().model
+            return self._model
+
+    def run(self, deadline):
+        """Process leases until the queue is empty or the deadline has passed.
+
+        Args:
+            deadline: The time, in seconds since the epoch, after which no more
+                tasks are leased.
+
+        Returns:
+            The number of tasks processed.
+        """
+
+        processed = 0
+        while time.time() < deadline:
+            count = self.run_once()
+            if not count:
+                break
+            processed += count
+        return processed
+
+    def run_once(self):
+        """Lease one batch of tasks, solve their puzzles and write the results.
+
+        The tasks are deleted once their results have been written. Tasks that
+        fail are handled by _finish().
+
+        Returns:
+            The number of tasks processed.
+        """
+
+        tasks = self.queue.lease_tasks(self.lease_seconds, self.batch_size)
+        if not tasks:
+            return 0
+        outcomes = [None] * len(tasks)
+        filenames = [None] * len(tasks)
+        images_data = [None] * len(tasks)
+        for i, task in enumerate(tasks):
+            try:
+                filenames[i], images_data[i], image_url = (
+                        pull_queue.decode_payload(task.payload))
+                if not images_data[i] and image_url:
+                    images_data[i] = self.fetch_image(image_url)
+            except Exception as e:
+                logging.exception("could not read task %s", task.name)
+                outcomes[i] = e
+
+        pending = [i for i, outcome in enumerate(outcomes) if outcome is None]
+        try:
+            solutions = self.solve_images([images_data[i] for i in pending])
+        except Exception as e:
+            logging.exception("could not solve a batch of %d images",
+                              len(pending))
+            solutions = [e] * len(pending)
+        for i, image_solution in zip(pending, solutions):
+            if isinstance(image_solution, Exception):
+                outcomes[i] = image_solution
+                continue
+            try:
+                outcomes[i] = self.write_result(filenames[i], image_solution)
+            except Exception as e:
+                logging.exception("could not write %s", filenames[i])
+                outcomes[i] = e
+
+        finished = self._finish(tasks, outcomes)
+        logging.info("solved a batch of %d images", len(finished))
+        return len(tasks)
+
+    def solve_images(self, images_data):
+        """Parse and solve a batch of puzzle images.
+
+        Args:
+            images_data: A list of the data of each image as a string, or None
+                for images that could not be fetched.
+
+        Returns:
+            A list of the jpeg-encoded solution image for each puzzle, None
+            for puzzles that could not be solved, or the unexpected exception
+            raised while solving it.
+        """
+
+        solutions = [None] * len(images_data)
+        indexes = [i for i, image_data in enumerate(images_data) if image_data]
+        parsers = [sudoku_image_parser.SudokuImageParser(model=self.model)
+                   for i in indexes]
+        puzzles = sudoku_image_parser.parse_batch(
+                parsers, [images_data[i] for i in indexes])
+
+        for i, parser, puzzle in zip(indexes, parsers, puzzles):
+            if isinstance(puzzle, (IndexError,
+                                   sudoku_image_parser.ImageError)):
+                logging.debug(puzzle)
+                continue
+            if isinstance(puzzle, Exception):
+                solutions[i] = puzzle
+                continue
+            try:
+                solution = self.solver.solve(puzzle)
+                image_solution = parser.draw_solution(solution)
+                solutions[i] = parser.convert_to_jpeg(image_solution).tostring()
+            except (sudoku_solver.ContradictionError,
+                    sudoku_solver.BudgetExceeded, ValueError) as e:
+                logging.debug(e)
+            except Exception as e:
+                logging.exception("could not solve %s", puzzle)
+                solutions[i] = e
+        return solutions
+
+    def _finish(self, tasks, outcomes):
+        """Mark the results of a lease done, and delete their tasks.
+
+        Tasks that failed are left to be leased again when their lease
+        expires, unless they have already been retried retry_limit times: those
+        are answered with the error image and deleted, so that a task that
+        always fails doesn't keep its client waiting.
+
+        Args:
+            tasks: The leased tasks.
+            outcomes: For each task, the completion record returned by
+                write_result, or the exception raised while processing it.
+
+        Returns:
+            The list of the tasks deleted.
+        """
+
+        done = []
+        finished = []
+        for task, outcome in zip(tasks, outcomes):
+            if isinstance(outcome, Exception):
+                if task.retry_count <= self.retry_limit:
+                    continue
+                try:
+                    outcome = self._give_up(task)
+                except Exception:
+                    logging.exception("could not write the error result of "
+                                      "task %s", task.name)
+                    continue
+            if outcome is not None:
+                done.append(outcome)
+            finished.append(task)
+        if done:
+            self.mark_done(done)
+        if finished:
+            self.queue.delete_tasks(finished)
+        return finished
+
+    def _give_up(self, task):
+        """Write the error image as the result of a task that keeps failing.
+
+        Returns:
+            The completion record of the result, or None if the task's payload
+            can't be decoded.
+        """
+
+        logging.error("giving up on task %s after %d leases", task.name,
+                      task.retry_count)
+        try:
+            filename = pull_queue.decode_payload(task.payload)[0]
+        except Exception:
+            logging.exception("could not decode task %s", task.name)
+            return None
+        return self.write_result(filename, None)
+
+
+class PipelinedBatchSolveWorker(BatchSolveWorker):
+    """A BatchSolveWorker that overlaps the network and CPU work of a lease.
+
+    The images of a lease go through a pipeline of fetch, CPU (parse, solve and
+    draw) and upload stages, each run by its own pool of threads, so that the
+    fetches and uploads of some images overlap with the OCR of others.
+
+    Attributes:
+        pipeline: The pipeline.Pipeline run for each lease.
+        cpu_pool: cpu_pool.CpuPool running the CPU stage's work, or None to
+            run it in the stage's threads.
+
+    Without a cpu_pool, each CPU thread parses with an OCR model of its own.
+    The models are kept for the next leases rather than trained again.
+    """
+
+    def __init__(self, queue, fetch_image, write_result, mark_done,
+                 batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS,
+                 fetch_threads=FETCH_THREADS, cpu_threads=CPU_THREADS,
+                 upload_threads=UPLOAD_THREADS,
+                 queue_size=STAGE_QUEUE_SIZE, cpu_pool=None,
+                 budget=(None, None), retry_limit=RETRY_LIMIT):
+        """Initialize the PipelinedBatchSolveWorker object and attributes.
+
+        Args:
+            fetch_threads, cpu_threads, upload_threads: Number of threads of
+                each stage.
+            queue_size: Maximum number of items waiting for each stage.
+            cpu_pool: cpu_pool.CpuPool to run the CPU stage's work in.
+        """
+
+        super(PipelinedBatchSolveWorker, self).__init__(
+                queue, fetch_image, write_result, mark_done,
+                batch_size=batch_size, lease_seconds=lease_seconds,
+                budget=budget, retry_limit=retry_limit)
+        self.cpu_pool = cpu_pool
+        # Trained OCR models not in use by a CPU thread.
+        self._models = Queue.Queue()
+        self.pipeline = pipeline.Pipeline([
+                pipeline.Stage('fetch', self._fetch, fetch_threads, queue_size),
+                pipeline.Stage('cpu', self._solve, cpu_threads, queue_size),
+                pipeline.Stage('upload', self._upload, upload_threads,
+                               queue_size)])
+
+    def run_once(self):
+        """Lease one batch of tasks, and run them through the pipeline.
+
+        Tasks are deleted once their results have been written. Tasks that
+        fail in any stage are handled by _finish().
+
+        Returns:
+            The number of tasks processed.
+        """
+
+        tasks = self.queue.lease_tasks(self.lease_seconds, self.batch_size)
+        if not tasks:
+            return 0
+        outputs = self.pipeline.map([task.payload for task in tasks])
+
+        finished = self._finish(tasks, outputs)
+        logging.info("solved a batch of %d images; stages: %s",
+                     len(finished), self.pipeline.stats())
+        return len(tasks)
+
+    def _fetch(self, payload):
+        """Fetch stage: decode a task payload and get its image data."""
+
+        filename, image_data, image_url = pull_queue.decode_payload(payload)
+        if not image_data and image_url:
+            image_data = self.fetch_image(image_url)
+        return filename, image_data
+
+    def _solve(self, item):
+        """CPU stage: parse and solve an image, and draw its solution."""
+
+        filename, image_data = item
+        if not image_data:
+            return filename, None
+        if self.cpu_pool:
+            try:
+                puzzle, image_solution = self.cpu_pool.solve(image_data,
+                                                             self.budget)
+                return filename, image_solution
+            except (IndexError, ValueError, sudoku_image_parser.ImageError,
+                    sudoku_solver.ContradictionError,
+                    sudoku_solver.BudgetExceeded) as e:
+                logging.debug(e)
+                return filename, None
+        # OCR models are not shared between threads.
+        try:
+            model = self._models.get_nowait()
+        except Queue.Empty:
+            model = sudoku_image_parser.SudokuImageParser().model
+        parser = sudoku_image_parser.SudokuImageParser(model=model)
+        try:
+            puzzle = parser.parse(image_data)
+            solution = self.solver.solve(puzzle)
+            image_solution = parser.draw_solution(solution)
+            return filename, parser.convert_to_jpeg(image_solution).tostring()
+        except (IndexError, ValueError, sudoku_image_parser.ImageError,
+                sudoku_solver.ContradictionError,
+                sudoku_solver.BudgetExceeded) as e:
+            logging.debug(e)
+            return filename, None
+        finally:
+            self._models.put(model)
+
+    def _upload(self, item):
+        """Upload stage: write a result."""
+
+        filename, image_solution = item
+        return self.write_result(filename, image_solution)
@@ -0,0 +1,355 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the image pipeline: parse, solve, draw and encode.
+
+Each test puzzle image, and variants of it that are scaled, rotated, warped in
+perspective, blurred or recompressed as JPEG, is run through the pipeline the
+solver module runs. The latency percentiles of each stage and of the total,
+the memory high-water mark, and the OCR accuracy against the puzzles listed in
+test_puzzles/expected.json are reported, and compared with a stored baseline
+to catch regressions.
+
+Usage: python benchmark_pipeline.py [-n REPEAT] [--save-baseline]
+                                    [--check] [--baseline FILE]
+                                    [--expected FILE] [--originals-only]
+
+Run it from the repo root, where the OCR training data is.
+"""
+
+import argparse
+import collections
+import json
+import os
+import resource
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import sudoku_image_parser
+import sudoku_solver
+
+
+PUZZLES_DIR = 'test_puzzles'
+EXPECTED_FILE = os.path.join(PUZZLES_DIR, 'expected.json')
+BASELINE_FILE = os.path.join(PUZZLES_DIR, 'benchmark_baseline.json')
+
+STAGES = ('parse', 'solve', 'draw', 'encode', 'total')
+PERCENTILES = (50, 90, 99)
+
+# Largest allowed increase, as a fraction of the baseline, of a stage's
+# latency percentiles and of the memory high-water mark.
+LATENCY_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+# Largest allowed drop of the OCR cell accuracy.
+ACCURACY_TOLERANCE = 0.01
+
+
+def scale(factor):
+    """Return an augmentation resizing an image by factor."""
+
+    def augment(image):
+        return cv2.resize(image, None, fx=factor, fy=factor,
+                          interpolation=cv2.INTER_AREA)
+    return augment
+
+
+def rotate(degrees):
+    """Return an augmentation rotating an image about its center."""
+
+    def augment(image):
+        height, width = image.shape[:2]
+        matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0),
+                                         degrees, 1.0)
+        return cv2.warpAffine(image, matrix, (width, height),
+                              borderMode=cv2.BORDER_REPLICATE)
+    return augment
+
+
+def perspective(skew):
+    """Return an augmentation warping an image as if seen from the side; skew
+    is the fraction of the width by which the top edge is narrowed."""
+
+    def augment(image):
+        height, width = image.shape[:2]
+        inset = skew * width / 2.0
+        corners = np.float32([[0, 0], [width, 0], [width, height],
+                              [0, height]])
+        warped = np.float32([[inset, 0], [width - inset, 0], [width, height],
+                             [0, height]])
+        matrix = cv2.getPerspectiveTransform(corners, warped)
+        return cv2.warpPerspective(image, matrix, (width, height),
+                                   borderMode=cv2.BORDER_REPLICATE)
+    return augment
+
+
+def blur(kernel):
+    """Return an augmentation blurring an image with a Gaussian kernel."""
+
+    def augment(image):
+        return cv2.GaussianBlur(image, (kernel, kernel), 0)
+    return augment
+
+
+# The variants of each image, as (name, augmentation, JPEG quality or None to
+# encode as PNG).
+VARIANTS = (
+    ('original', None, None),
+    ('scale-0.5', scale(0.5), None),
+    ('scale-1.5', scale(1.5), None),
+    ('rotate-3', rotate(3), None),
+    ('rotate-8', rotate(-8), None),
+    ('perspective-0.05', perspective(0.05), None),
+    ('perspective-0.15', perspective(0.15), None),
+    ('blur-3', blur(3), None),
+    ('blur-7', blur(7), None),
+    ('jpeg-75', None, 75),
+    ('jpeg-30', None, 30),
+)
+
+
+def encode(image, quality=None):
+    """Return an image as PNG data, or as JPEG data of the given quality."""
+
+    if quality is None:
+        _, data = cv2.imencode('.png', image)
+    else:
+        _, data = cv2.imencode('.jpg', image,
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return data.tostring()
+
+
+def load_cases(expected_file=EXPECTED_FILE, variants=VARIANTS):
+    """Return the benchmark cases: (name, image data, expected puzzle).
+
+    Args:
+        expected_file: JSON file mapping the file names of images, relative
+            to its directory, to their puzzles; e.g. one written by
+            generate_puzzle_images.py.
+        variants: The variants of each image to run.
+    """
+
+    with open(expected_file) as f:
+        expected = json.load(f)
+    cases = []
+    for filename in sorted(expected):
+        path = os.path.join(os.path.dirname(expected_file), filename)
+        image = cv2.imread(path, cv2.CV_LOAD_IMAGE_COLOR)
+        if image is None:
+            raise IOError('Could not read %s.' % path)
+        for name, augment, quality in variants:
+            variant = augment(image) if augment else image
+            cases.append(('%s/%s' % (filename, name),
+                          encode(variant, quality), expected[filename]))
+    return cases
+
+
+def run_pipeline(parser, image_data):
+    """Run an image through the pipeline, timing each stage.
+
+    Returns:
+        A tuple of the parsed puzzle, or None if parsing failed, a dict of the
+        seconds taken by each stage that ran, and the name of the error
+        raised, or None.
+    """
+
+    seconds = {}
+    puzzle = None
+    start = time.time()
+    try:
+        puzzle = parser.parse(image_data)
+        parsed = time.time()
+        seconds['parse'] = parsed - start
+        solution = sudoku_solver.SudokuSolver().solve(puzzle)
+        solved = time.time()
+        seconds['solve'] = solved - parsed
+        image = parser.draw_solution(solution)
+        drawn = time.time()
+        seconds['draw'] = drawn - solved
+        parser.convert_to_jpeg(image)
+        seconds['encode'] = time.time() - drawn
+        seconds['total'] = time.time() - start
+    except (sudoku_image_parser.ImageError,
+            sudoku_solver.ContradictionError, sudoku_solver.BudgetExceeded,
+            IndexError, ValueError) as e:
+        return puzzle, seconds, e.__class__.__name__
+    return puzzle, seconds, None
+
+
+def percentile(values, p):
+    """Return the p-th percentile of sorted values, by nearest rank."""
+
+    if not values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def benchmark(cases, repeat=1):
+    """Run the benchmark cases through the pipeline.
+
+    Args:
+        cases: List of (name, image data, expected puzzle) tuples.
+        repeat: Number of times to run each case.
+
+    Returns:
+        A dict of the results, as stored in the baseline.
+    """
+
+    model_start = time.time()
+    model = sudoku_image_parser.SudokuImageParser(recent_parses=None).model
+    model_seconds = time.time() - model_start
+
+    times = collections.defaultdict(list)
+    errors = collections.Counter()
+    failed = []
+    correct_cells = correct_puzzles = runs = 0
+    for name, image_data, expected in cases:
+        for _ in xrange(repeat):
+            # A fresh parser without the index of recent parses, so that every
+            # run does the OCR.
+            parser = sudoku_image_parser.SudokuImageParser(
+                    recent_parses=None, model=model)
+            puzzle, seconds, error = run_pipeline(parser, image_data)
+            runs += 1
+            for stage, value in seconds.items():
+                times[stage].append(value)
+            if error:
+                errors[error] += 1
+                failed.append(name)
+            if puzzle and len(puzzle) == len(expected):
+                matches = sum(1 for got, want in zip(puzzle, expected)
+                              if got == want)
+                correct_cells += matches
+                correct_puzzles += matches == len(expected)
+
+    latency = {}
+    for stage in STAGES:
+        values = sorted(times[stage])
+        latency[stage] = dict(
+                [('p%d' % p, _ms(percentile(values, p)))
+                 for p in PERCENTILES] +
+                [('max', _ms(values[-1] if values else None))])
+    return {
+        'runs': runs,
+        'model_ms': _ms(model_seconds),
+        'latency_ms': latency,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'ocr_cell_accuracy': round(correct_cells / (81.0 * runs), 4),
+        'ocr_puzzle_accuracy': round(correct_puzzles / float(runs), 4),
+        'errors': dict(errors),
+        'failed': sorted(set(failed)),
+    }
+
+
+def _ms(seconds):
+    """Return seconds as milliseconds, rounded, or None."""
+
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def regressions(results, baseline):
+    """Return a list of the ways the results regress from the baseline."""
+
+    found = []
+    for stage in STAGES:
+        for key in ['p%d' % p for p in PERCENTILES[:2]]:
+            now = results['latency_ms'][stage][key]
+            before = baseline['latency_ms'].get(stage, {}).get(key)
+            if now is not None and before and (
+                    now > before * (1 + LATENCY_TOLERANCE)):
+                found.append('%s %s latency %.2f ms, baseline %.2f ms'
+                             % (stage, key, now, before))
+    if results['max_rss_kb'] > baseline['max_rss_kb'] * (1 + MEMORY_TOLERANCE):
+        found.append('memory high-water mark %d KB, baseline %d KB'
+                     % (results['max_rss_kb'], baseline['max_rss_kb']))
+    if (results['ocr_cell_accuracy'] <
+            baseline['ocr_cell_accuracy'] - ACCURACY_TOLERANCE):
+        found.append('OCR cell accuracy %.4f, baseline %.4f'
+                     % (results['ocr_cell_accuracy'],
+                        baseline['ocr_cell_accuracy']))
+    newly_failed = set(results['failed']) - set(baseline['failed'])
+    if newly_failed:
+        found.append('newly failing: %s' % ', '.join(sorted(newly_failed)))
+    return found
+
+
+def report(results, output=sys.stdout):
+    """Write the results as a table."""
+
+    output.write('%-8s' % 'stage' + ''.join(
+            '%10s' % key for key in ['p%d' % p for p in PERCENTILES] + ['max'])
+                 + '\n')
+    for stage in STAGES:
+        row = results['latency_ms'][stage]
+        output.write('%-8s' % stage + ''.join(
+                '%10s' % ('-' if row[key] is None else '%.2f' % row[key])
+                for key in ['p%d' % p for p in PERCENTILES] + ['max']) + '\n')
+    output.write('Runs: %d. Model training: %.2f ms. Max RSS: %d KB.\n'
+                 % (results['runs'], results['model_ms'],
+                    results['max_rss_kb']))
+    output.write('OCR accuracy: %.2f%% of cells, %.2f%% of puzzles.\n'
+                 % (100 * results['ocr_cell_accuracy'],
+                    100 * results['ocr_puzzle_accuracy']))
+    if results['errors']:
+        output.write('Errors: %s. Failing: %s.\n' % (
+                ', '.join('%s %d' % item
+                          for item in sorted(results['errors'].items())),
+                ', '.join(results['failed'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Benchmark the image pipeline on the test puzzles.')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='number of runs of each image variant')
+    parser.add_argument('--expected', default=EXPECTED_FILE,
+                        help='JSON file of the images to run and their '
+                        'puzzles')
+    parser.add_argument('--originals-only', action='store_true',
+                        help='run only the images, not their variants')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='baseline file to check against or save to')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error if the results regress from '
+                        'the baseline')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    variants = VARIANTS[:1] if args.originals_only else VARIANTS
+    results = benchmark(load_cases(args.expected, variants), args.repeat)
+    report(results)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        sys.stderr.write('Saved baseline to %s.\n' % args.baseline)
+    if args.check:
+        if not os.path.exists(args.baseline):
+            sys.stderr.write('No baseline at %s; run with --save-baseline.\n'
+                             % args.baseline)
+            return 1
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f))
+        for regression in found:
+            sys.stderr.write('Regression: %s.\n' % regression)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
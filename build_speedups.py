@@ -0,0 +1,29 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Builds the optional compiled engine, sudoku_core/_speedups, in place.
+
+Run `python build_speedups.py`; it needs a C compiler and the Python headers.
+Without it, sudoku_core uses its pure Python engine.
+"""
+
+from distutils.core import Extension, setup
+
+
+if __name__ == '__main__':
+    setup(name='sudoku_core_speedups',
+          ext_modules=[Extension('sudoku_core._speedups',
+                                 ['sudoku_core/_speedups.c'],
+                                 extra_compile_args=['-O2'])],
+          script_args=['build_ext', '--inplace'])
@@ -26,4 +26,7 @@ from .common import validate_bucket_name
 from .common import validate_bucket_path
 from .common import validate_file_path
 from errors import *
+from .local_backend import FileBackend
+from .local_backend import MemoryBackend
+from .local_backend import set_backend
 from storage_api import *
@@ -99,9 +99,14 @@ def _unquote_filename(filename):
 
 def _should_retry(resp):
   """Given a urlfetch response, decide whether to retry that request."""
-  return (resp.status_code == httplib.REQUEST_TIMEOUT or
-          (resp.status_code >= 500 and
-           resp.status_code < 600))
+  return _should_retry_status(resp.status_code)
+
+
+def _should_retry_status(status):
+  """Given an HTTP status code, decide whether to retry that request."""
+  return (status == httplib.REQUEST_TIMEOUT or
+          (status >= 500 and
+           status < 600))
 
 
 class RetryParams(object):
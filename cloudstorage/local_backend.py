@@ -0,0 +1,486 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+# either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""In-process stand-ins for Google Cloud Storage.
+
+A Backend answers the Google Cloud Storage XML API requests that the rest of
+this library makes (ranged GET, HEAD, DELETE, resumable uploads, copies and
+GET bucket) from local storage, with optional latency and fault injection.
+Once a backend is set with set_backend(), every open/stat/listbucket/delete/
+_copy2 call and every ReadBuffer and StreamingBuffer talks to it instead of
+GCS, so their I/O can be exercised and benchmarked offline:
+
+  local_backend.set_backend(local_backend.MemoryBackend(latency=0.02))
+  with cloudstorage.open('/bucket/file', 'w') as f:
+    f.write(data)
+
+MemoryBackend keeps objects in process memory; FileBackend keeps them under a
+local directory, where they outlive the process.
+"""
+
+
+
+
+
+__all__ = ['Backend',
+           'FileBackend',
+           'get_backend',
+           'MemoryBackend',
+           'set_backend',
+           'TIMEOUT',
+          ]
+
+import collections
+import hashlib
+import httplib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib
+import urlparse
+from xml.sax import saxutils
+
+from . import common
+
+try:
+  from google.appengine.api import urlfetch
+except ImportError:
+  from google.appengine.api import urlfetch
+
+
+API_URL = 'http://gcs.local'
+
+TIMEOUT = 'timeout'
+
+_UPLOAD_PREFIX = '#uploads/'
+
+_STORED_HEADERS = ['cache-control',
+                   'content-disposition',
+                   'content-encoding',
+                   'content-type',
+                  ]
+
+_DEFAULT_CONTENT_TYPE = 'binary/octet-stream'
+
+_backend = None
+
+
+def set_backend(backend):
+  """Send all requests of this process to a Backend.
+
+  Args:
+    backend: a Backend, or None to talk to Google Cloud Storage again.
+  """
+  global _backend
+  _backend = backend
+
+
+def get_backend():
+  """Returns the Backend set by set_backend(), or None."""
+  return _backend
+
+
+class Backend(object):
+  """Base class of the local stand-ins for Google Cloud Storage.
+
+  Subclasses store records, each a content str and an info dict, by key with
+  _get, _put, _append, _delete and _keys.
+
+  Attributes:
+    latency: seconds added to every request.
+    latency_jitter: up to this many more seconds, at random, are added to
+      every request.
+    fault_rate: fraction of requests, at random, that fail.
+    fault_status: HTTP status of the failed requests, or TIMEOUT to raise
+      urlfetch.DownloadError as if they timed out.
+    fault_methods: HTTP methods that can fail, or None for all of them.
+    requests: collections.Counter of the requests answered, by method.
+  """
+
+  def __init__(self,
+               latency=0.0,
+               latency_jitter=0.0,
+               fault_rate=0.0,
+               fault_status=httplib.SERVICE_UNAVAILABLE,
+               fault_methods=None,
+               seed=None):
+    """Init.
+
+    Args:
+      latency: seconds added to every request.
+      latency_jitter: up to this many more seconds, at random, are added to
+        every request.
+      fault_rate: fraction of requests, at random, that fail.
+      fault_status: HTTP status of the failed requests, or TIMEOUT.
+      fault_methods: HTTP methods that can fail, e.g. ['PUT'], or None for
+        all of them.
+      seed: seed of the random latencies and faults.
+    """
+    self.latency = latency
+    self.latency_jitter = latency_jitter
+    self.fault_rate = fault_rate
+    self.fault_status = fault_status
+    self.fault_methods = fault_methods
+    self.requests = collections.Counter()
+    self._random = random.Random(seed)
+    self._faults = collections.deque()
+    self._lock = threading.RLock()
+
+  def inject_faults(self, count, status=httplib.SERVICE_UNAVAILABLE,
+                    methods=None):
+    """Make the next requests fail.
+
+    Args:
+      count: number of requests to fail.
+      status: HTTP status of the failed requests, or TIMEOUT.
+      methods: HTTP methods that can fail, or None for all of them.
+    """
+    with self._lock:
+      for _ in xrange(count):
+        self._faults.append((status, methods))
+
+  def handle_request(self, method, url, headers=None, payload=None):
+    """Answer a Google Cloud Storage XML API request.
+
+    Args:
+      method: HTTP method.
+      url: URL of the request; only its path and query are used.
+      headers: HTTP request headers.
+      payload: request body.
+
+    Returns:
+      A tuple of (status, headers, content) like _StorageApi's.
+
+    Raises:
+      urlfetch.DownloadError: if a timeout fault is injected.
+    """
+    delay = self.latency
+    if self.latency_jitter:
+      delay += self._random.uniform(0, self.latency_jitter)
+    if delay:
+      time.sleep(delay)
+
+    headers = dict((k.lower(), v) for k, v in (headers or {}).iteritems())
+    _, _, path, query, _ = urlparse.urlsplit(url)
+    query = dict(urlparse.parse_qsl(query))
+    with self._lock:
+      self.requests[method] += 1
+      fault = self._next_fault(method)
+      if fault == TIMEOUT:
+        raise urlfetch.DownloadError('Injected timeout.')
+      if fault is not None:
+        return fault, {}, 'Injected fault.'
+      return self._dispatch(method, path, query, headers, payload or '')
+
+  def _next_fault(self, method):
+    """Returns the status of the fault to inject, TIMEOUT or None."""
+    for i, (status, methods) in enumerate(self._faults):
+      if methods is None or method in methods:
+        del self._faults[i]
+        return status
+    if (self.fault_rate and
+        (self.fault_methods is None or method in self.fault_methods) and
+        self._random.random() < self.fault_rate):
+      return self.fault_status
+    return None
+
+  def _dispatch(self, method, path, query, headers, payload):
+    """Route a request to the method emulating it."""
+    path = urllib.unquote(path)
+    if path.count('/') < 2:
+      if method == 'GET':
+        return self._get_bucket(path, query)
+    elif 'upload_id' in query:
+      if method == 'PUT':
+        return self._put_upload(query['upload_id'], headers, payload)
+    elif method == 'GET':
+      return self._get_object(path, headers)
+    elif method == 'HEAD':
+      return self._head_object(path)
+    elif method == 'DELETE':
+      return self._delete_object(path)
+    elif method == 'POST' and headers.get('x-goog-resumable') == 'start':
+      return self._start_upload(path, headers)
+    elif method == 'PUT' and 'x-goog-copy-source' in headers:
+      return self._copy_object(path, headers)
+    elif method == 'PUT':
+      return self._put_object(path, headers, payload)
+    return httplib.METHOD_NOT_ALLOWED, {}, ''
+
+  def _get_object(self, path, headers):
+    record = self._get(path)
+    if record is None:
+      return httplib.NOT_FOUND, {}, ''
+    content, info = record
+    resp_headers = self._object_headers(content, info)
+    requested = headers.get('range')
+    if not requested or not content:
+      return httplib.OK, resp_headers, content
+    start, end = requested.split('=', 1)[1].split('-')
+    start = int(start)
+    end = min(int(end), len(content) - 1) if end else len(content) - 1
+    if start >= len(content):
+      return httplib.REQUESTED_RANGE_NOT_SATISFIABLE, resp_headers, ''
+    resp_headers['content-range'] = 'bytes %d-%d/%d' % (start, end,
+                                                        len(content))
+    resp_headers['content-length'] = str(end - start + 1)
+    return httplib.PARTIAL_CONTENT, resp_headers, content[start:end + 1]
+
+  def _head_object(self, path):
+    record = self._get(path)
+    if record is None:
+      return httplib.NOT_FOUND, {}, ''
+    return httplib.OK, self._object_headers(*record), ''
+
+  def _delete_object(self, path):
+    if not self._delete(path):
+      return httplib.NOT_FOUND, {}, ''
+    return httplib.NO_CONTENT, {}, ''
+
+  def _put_object(self, path, headers, payload):
+    self._put(path, payload, self._object_info(payload, headers))
+    return httplib.OK, {'etag': '"%s"' % hashlib.md5(payload).hexdigest()}, ''
+
+  def _copy_object(self, path, headers):
+    source = self._get(urllib.unquote(headers['x-goog-copy-source']))
+    if source is None:
+      return httplib.NOT_FOUND, {}, ''
+    content, info = source
+    if headers.get('x-goog-metadata-directive') == 'REPLACE':
+      info = self._object_info(content, headers)
+    else:
+      info = dict(info, ctime=time.time())
+    self._put(path, content, info)
+    return httplib.OK, {'etag': info['etag']}, ''
+
+  def _start_upload(self, path, headers):
+    upload_id = os.urandom(16).encode('hex')
+    self._put(_UPLOAD_PREFIX + upload_id, '',
+              {'path': path, 'headers': self._stored_headers(headers)})
+    location = '%s%s?upload_id=%s' % (API_URL, urllib.quote(path), upload_id)
+    return httplib.CREATED, {'location': location}, ''
+
+  def _put_upload(self, upload_id, headers, payload):
+    key = _UPLOAD_PREFIX + upload_id
+    record = self._get(key)
+    if record is None:
+      return httplib.NOT_FOUND, {}, ''
+    written = len(record[0])
+    byte_range, total = headers.get('content-range', 'bytes */*')[6:].split('/')
+    if byte_range != '*':
+      start, end = [int(offset) for offset in byte_range.split('-')]
+      if start != written or end - start + 1 != len(payload):
+        return httplib.BAD_REQUEST, {}, 'Content-Range does not match upload.'
+      self._append(key, payload)
+      written += len(payload)
+    if total == '*':
+      resp_headers = {}
+      if written:
+        resp_headers['range'] = 'bytes=0-%d' % (written - 1)
+      return 308, resp_headers, ''
+    if int(total) != written:
+      return httplib.BAD_REQUEST, {}, 'Upload is not %s bytes long.' % total
+    content, info = self._get(key)
+    self._delete(key)
+    return self._put_object(info['path'], info['headers'], content)
+
+  def _get_bucket(self, bucket, query):
+    prefix = query.get('prefix', '')
+    marker = query.get('marker')
+    delimiter = query.get('delimiter')
+    max_keys = min(int(query.get('max-keys', common._MAX_GET_BUCKET_RESULT)),
+                   common._MAX_GET_BUCKET_RESULT)
+
+    entries = []
+    for key in self._keys(bucket + '/' + prefix):
+      name = key[len(bucket) + 1:]
+      if delimiter:
+        end = name.find(delimiter, len(prefix))
+        if end >= 0:
+          name = name[:end + len(delimiter)]
+          if entries and entries[-1][0] == name:
+            continue
+          if marker is None or name > marker:
+            entries.append((name, None))
+          continue
+      if marker is None or name > marker:
+        entries.append((name, key))
+
+    truncated = len(entries) > max_keys
+    entries = entries[:max_keys]
+    xml = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<ListBucketResult xmlns="%s">' % common.CS_XML_NS,
+           '<Name>%s</Name>' % saxutils.escape(bucket[1:]),
+           '<Prefix>%s</Prefix>' % saxutils.escape(prefix),
+           '<IsTruncated>%s</IsTruncated>' % ('true' if truncated else 'false')]
+    if truncated:
+      xml.append('<NextMarker>%s</NextMarker>' %
+                 saxutils.escape(entries[-1][0]))
+    for name, key in entries:
+      if key is None:
+        xml.append('<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>' %
+                   saxutils.escape(name))
+        continue
+      content, info = self._get(key)
+      xml.append('<Contents><Key>%s</Key><LastModified>%s</LastModified>'
+                 '<ETag>%s</ETag><Size>%d</Size></Contents>' %
+                 (saxutils.escape(name), common.posix_to_dt_str(info['ctime']),
+                  info['etag'], len(content)))
+    xml.append('</ListBucketResult>')
+    return httplib.OK, {'content-type': 'application/xml'}, ''.join(xml)
+
+  def _stored_headers(self, headers):
+    """Returns the headers kept with an object."""
+    return dict((k, v) for k, v in headers.iteritems()
+                if k in _STORED_HEADERS or
+                any(k.startswith(m) for m in common._GCS_METADATA))
+
+  def _object_info(self, content, headers):
+    """Returns the info dict of a new object."""
+    info = self._stored_headers(headers)
+    info.setdefault('content-type', _DEFAULT_CONTENT_TYPE)
+    info['etag'] = '"%s"' % hashlib.md5(content).hexdigest()
+    info['ctime'] = time.time()
+    return info
+
+  def _object_headers(self, content, info):
+    """Returns the response headers describing an object."""
+    headers = dict((k, v) for k, v in info.iteritems() if k != 'ctime')
+    headers['content-length'] = str(len(content))
+    headers['last-modified'] = common.posix_time_to_http(info['ctime'])
+    return headers
+
+  def _get(self, key):
+    """Returns the (content, info) record of a key, or None."""
+    raise NotImplementedError()
+
+  def _put(self, key, content, info):
+    """Store a record, replacing any with the same key."""
+    raise NotImplementedError()
+
+  def _append(self, key, data):
+    """Append data to the content of a record."""
+    content, info = self._get(key)
+    self._put(key, content + data, info)
+
+  def _delete(self, key):
+    """Delete a record. Returns True if it existed."""
+    raise NotImplementedError()
+
+  def _keys(self, prefix):
+    """Returns the sorted keys of the objects starting with prefix."""
+    raise NotImplementedError()
+
+
+class MemoryBackend(Backend):
+  """A Backend keeping objects in process memory."""
+
+  def __init__(self, **kwds):
+    """Init. See Backend for the arguments."""
+    super(MemoryBackend, self).__init__(**kwds)
+    self._records = {}
+
+  def _get(self, key):
+    return self._records.get(key)
+
+  def _put(self, key, content, info):
+    self._records[key] = (content, info)
+
+  def _delete(self, key):
+    return self._records.pop(key, None) is not None
+
+  def _keys(self, prefix):
+    return sorted(key for key in self._records
+                  if key.startswith(prefix) and
+                  not key.startswith(_UPLOAD_PREFIX))
+
+
+def _utf8(value):
+  """Returns a value loaded from JSON with its unicode strs encoded as str."""
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  if isinstance(value, dict):
+    return dict((_utf8(k), _utf8(v)) for k, v in value.iteritems())
+  return value
+
+
+class FileBackend(Backend):
+  """A Backend keeping objects as files under a local directory.
+
+  The content of each object is in root/data and its info, as JSON, in
+  root/info, both named by the quoted object path.
+  """
+
+  def __init__(self, root, **kwds):
+    """Init.
+
+    Args:
+      root: directory to keep the objects in; created if missing.
+      **kwds: see Backend.
+    """
+    super(FileBackend, self).__init__(**kwds)
+    self.root = root
+    for subdir in ('data', 'info'):
+      path = os.path.join(root, subdir)
+      if not os.path.isdir(path):
+        os.makedirs(path)
+
+  def _paths(self, key):
+    name = urllib.quote(key, safe='')
+    return (os.path.join(self.root, 'data', name),
+            os.path.join(self.root, 'info', name))
+
+  def _write(self, path, data):
+    """Replace a file atomically."""
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+    os.rename(temp, path)
+
+  def _get(self, key):
+    data_path, info_path = self._paths(key)
+    try:
+      with open(info_path) as f:
+        info = _utf8(json.load(f))
+      with open(data_path, 'rb') as f:
+        return f.read(), info
+    except IOError:
+      return None
+
+  def _put(self, key, content, info):
+    data_path, info_path = self._paths(key)
+    self._write(data_path, content)
+    self._write(info_path, json.dumps(info))
+
+  def _append(self, key, data):
+    with open(self._paths(key)[0], 'ab') as f:
+      f.write(data)
+
+  def _delete(self, key):
+    data_path, info_path = self._paths(key)
+    if not os.path.exists(info_path):
+      return False
+    os.remove(info_path)
+    os.remove(data_path)
+    return True
+
+  def _keys(self, prefix):
+    keys = (urllib.unquote(name)
+            for name in os.listdir(os.path.join(self.root, 'info')))
+    return sorted(key for key in keys
+                  if key.startswith(prefix) and
+                  not key.startswith(_UPLOAD_PREFIX))
@@ -24,11 +24,13 @@ __all__ = ['ReadBuffer',
 
 import collections
 import os
+import time
 import urlparse
 
 from . import api_utils
 from . import common
 from . import errors
+from . import local_backend
 from . import rest_api
 
 try:
@@ -56,6 +58,11 @@ def _get_storage_api(retry_params, account_id=None):
   """
 
 
+  if local_backend.get_backend() is not None:
+    return _LocalStorageApi(_StorageApi.full_control_scope,
+                            service_account_id=account_id,
+                            retry_params=retry_params)
+
   api = _StorageApi(_StorageApi.full_control_scope,
                     service_account_id=account_id,
                     retry_params=retry_params)
@@ -173,6 +180,55 @@ class _StorageApi(rest_api._RestApi):
 _StorageApi = rest_api.add_sync_methods(_StorageApi)
 
 
+class _LocalStorageApi(_StorageApi):
+  """A _StorageApi answered in process by local_backend.get_backend().
+
+  Requests skip authentication and urlfetch, but are retried on the same
+  statuses and with the same backoff as requests to Google Cloud Storage.
+  """
+
+  api_url = local_backend.API_URL
+
+  def __setstate__(self, state):
+    super(_LocalStorageApi, self).__setstate__(state)
+    self.api_url = local_backend.API_URL
+
+  def do_request_async(self, url, method='GET', headers=None, payload=None,
+                       deadline=None, callback=None):
+    """Inherit docs.
+
+    The returned future is already fulfilled.
+    """
+    backend = local_backend.get_backend()
+    n = 1
+    start_time = time.time()
+    while True:
+      error = None
+      try:
+        resp = backend.handle_request(method, url, headers, payload)
+        retry = api_utils._should_retry_status(resp[0])
+      except api_utils._RETRIABLE_EXCEPTIONS, e:
+        resp, error, retry = None, e, True
+      if not retry:
+        break
+      delay = self.retry_params.delay(n, start_time)
+      if delay <= 0:
+        break
+      time.sleep(delay)
+      n += 1
+
+    future = ndb.Future()
+    if error is not None:
+      future.set_exception(errors.TimeoutError(
+          'Request to Google Cloud Storage timed out.', error))
+    else:
+      future.set_result(resp)
+    return future
+
+
+_LocalStorageApi = rest_api.add_sync_methods(_LocalStorageApi)
+
+
 class ReadBuffer(object):
   """A class for reading Google storage files."""
 
@@ -594,6 +650,10 @@ class StreamingBuffer(object):
   The API is a subset of the Python writable stream API sufficient to
   support writing zip files using the zipfile module.
 
+  The resumable upload is only started once the buffered data must be
+  flushed. An object closed with at most _maxsimplesize bytes buffered and
+  no upload started is created by a single simple upload request instead.
+
   The exact sequence of calls and use of headers is documented at
   https://developers.google.com/storage/docs/developer-guide#unknownresumables
   """
@@ -604,6 +664,8 @@ class StreamingBuffer(object):
 
   _maxrequestsize = 9 * 4 * _blocksize
 
+  _maxsimplesize = _flushsize
+
   def __init__(self,
                api,
                path,
@@ -618,12 +680,11 @@ class StreamingBuffer(object):
         delegate to Google Cloud Storage.
       gcs_headers: additional gs headers as a str->str dict, e.g
         {'x-goog-acl': 'private', 'x-goog-meta-foo': 'foo'}.
-    Raises:
-      IOError: When this location can not be found.
     """
     assert self._maxrequestsize > self._blocksize
     assert self._maxrequestsize % self._blocksize == 0
     assert self._maxrequestsize >= self._flushsize
+    assert self._maxsimplesize <= self._maxrequestsize
 
     self._api = api
     self._path = path
@@ -636,19 +697,12 @@ class StreamingBuffer(object):
     self._written = 0
     self._offset = 0
 
-    headers = {'x-goog-resumable': 'start'}
+    self._headers = {}
     if content_type:
-      headers['content-type'] = content_type
+      self._headers['content-type'] = content_type
     if gcs_headers:
-      headers.update(gcs_headers)
-    status, resp_headers, content = self._api.post_object(path, headers=headers)
-    errors.check_status(status, [201], path, headers, resp_headers,
-                        body=content)
-    loc = resp_headers.get('location')
-    if not loc:
-      raise IOError('No location header found in 201 response')
-    parsed = urlparse.urlparse(loc)
-    self._path_with_token = '%s?%s' % (self._path, parsed.query)
+      self._headers.update(gcs_headers)
+    self._path_with_token = None
 
   def __getstate__(self):
     """Store state as part of serialization/pickling.
@@ -656,7 +710,8 @@ class StreamingBuffer(object):
     The contents of the write buffer are stored. Writes to the underlying
     storage are required to be on block boundaries (_blocksize) except for the
     last write. In the worst case the pickled version of this object may be
-    slightly larger than the blocksize.
+    slightly larger than the blocksize, or than _flushsize if the resumable
+    upload has not been started yet.
 
     Returns:
       A dictionary with the state of this object
@@ -665,6 +720,7 @@ class StreamingBuffer(object):
     return {'api': self._api,
             'path': self._path,
             'path_token': self._path_with_token,
+            'headers': self._headers,
             'buffer': self._buffer,
             'buffered': self._buffered,
             'written': self._written,
@@ -679,6 +735,7 @@ class StreamingBuffer(object):
     """
     self._api = state['api']
     self._path_with_token = state['path_token']
+    self._headers = state.get('headers', {})
     self._buffer = state['buffer']
     self._buffered = state['buffered']
     self._written = state['written']
@@ -746,10 +803,19 @@ class StreamingBuffer(object):
 
     Buffer is flushed to GCS only when the total amount of buffered data is at
     least self._blocksize, or to flush the final (incomplete) block of
-    the file with finish=True.
+    the file with finish=True. The resumable upload is started by the first
+    flush that sends data, unless the whole file fits in a simple upload.
     """
     blocksize_or_zero = 0 if finish else self._blocksize
 
+    if self._path_with_token is None:
+      if finish and self._buffered <= self._maxsimplesize:
+        self._send_simple()
+        return
+      if self._buffered < blocksize_or_zero:
+        return
+      self._start_upload()
+
     while self._buffered >= blocksize_or_zero:
       buffer = []
       buffered = 0
@@ -789,6 +855,36 @@ class StreamingBuffer(object):
       if file_len != '*':
         break
 
+  def _start_upload(self):
+    """Start the resumable upload and remember its upload path.
+
+    Raises:
+      IOError: When this location can not be found.
+    """
+    headers = {'x-goog-resumable': 'start'}
+    headers.update(self._headers)
+    status, resp_headers, content = self._api.post_object(self._path,
+                                                          headers=headers)
+    errors.check_status(status, [201], self._path, headers, resp_headers,
+                        body=content)
+    loc = resp_headers.get('location')
+    if not loc:
+      raise IOError('No location header found in 201 response')
+    parsed = urlparse.urlparse(loc)
+    self._path_with_token = '%s?%s' % (self._path, parsed.query)
+
+  def _send_simple(self):
+    """Create the file from the whole buffer with a single request."""
+    data = ''.join(self._buffer)
+    self._buffer.clear()
+    self._buffered = 0
+    headers = dict(self._headers)
+    status, response_headers, content = self._api.put_object(
+        self._path, payload=data, headers=headers)
+    errors.check_status(status, [200], self._path, headers,
+                        response_headers, content)
+    self._written += len(data)
+
   def _send_data(self, data, start_offset, file_len):
     """Send the block to the storage service.
 
@@ -844,14 +940,15 @@ class StreamingBuffer(object):
     """Close this buffer on file_length.
 
     Finalize this upload immediately on file_length.
-    Contents that are still in memory will not be uploaded.
-
-    This is a utility method that does not modify self.
+    Contents that are still in memory will not be uploaded. The resumable
+    upload is started first if no data has been flushed yet.
 
     Args:
       file_length: file length. Must match what has been uploaded. If None,
         it will be queried from GCS.
     """
+    if self._path_with_token is None:
+      self._start_upload()
     if file_length is None:
       file_length = self._get_offset_from_gcs() + 1
     self._send_data('', 0, file_length)
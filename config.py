@@ -1,4 +1,93 @@
+import os
+
+import yaml
 
 from google.appengine.api import app_identity
 
 BUCKET_NAME = '' or app_identity.get_default_gcs_bucket_name()
+
+# Images up to this size may be solved synchronously by /solve_sync.
+SYNC_MAX_IMAGE_BYTES = 512 * 1024
+# Maximum number of synchronous solves run at once by one solver instance.
+# Requests beyond this fall back to the task queue.
+SYNC_MAX_IN_FLIGHT = 4
+
+# Images up to this size are sent to the solver inside the task payload rather
+# than through GCS. Push tasks are limited to 100KB, so leave room for the
+# task's URL and headers.
+INLINE_IMAGE_MAX_BYTES = 90 * 1024
+
+# How long completion flags for asynchronous solves are kept in memcache.
+RESULT_TTL_SECONDS = 60 * 60
+# How long a /result request waits for a solve to finish before returning.
+RESULT_WAIT_SECONDS = 25
+
+# How long a submitted image is remembered, by content hash, so that
+# resubmitting it returns the earlier result.
+IMAGE_INDEX_TTL_SECONDS = 6 * 60 * 60
+# How long completion records of asynchronous solves are kept in the datastore
+# before /cleanup_results deletes them. Resubmitted images are answered from
+# them, so this is longer than IMAGE_INDEX_TTL_SECONDS.
+RESULT_RETENTION_SECONDS = 24 * 60 * 60
+# How long each /cleanup_results request keeps deleting expired records.
+RESULT_CLEANUP_SECONDS = 50
+
+# Request classes. Interactive solves, from the capture and upload pages, use
+# their own task queue so that a backlog of bulk/API solves doesn't delay them.
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+# Push queues for each request class, defined in queue.yaml.
+SOLVE_QUEUES = {INTERACTIVE: 'solve-interactive', BULK: 'solve-bulk'}
+
+
+def _read_queues():
+    """Return the settings of each queue in queue.yaml, by queue name."""
+
+    path = os.path.join(os.path.dirname(__file__), 'queue.yaml')
+    with open(path) as queue_file:
+        queues = yaml.safe_load(queue_file)['queue']
+    return {queue['name']: queue for queue in queues}
+
+
+_QUEUES = _read_queues()
+# The max_concurrent_requests of each queue, read from queue.yaml.
+SOLVE_QUEUE_CONCURRENCY = {
+    request_class: _QUEUES[name]['max_concurrent_requests']
+    for request_class, name in SOLVE_QUEUES.iteritems()}
+# The task_retry_limit of each queue, read from queue.yaml. A solve that fails
+# on its last attempt is answered with the error image.
+SOLVE_TASK_RETRY_LIMITS = {
+    request_class: _QUEUES[name]['retry_parameters']['task_retry_limit']
+    for request_class, name in SOLVE_QUEUES.iteritems()}
+
+# 'push' to solve each bulk image in its own /solve_async task handler, or
+# 'pull' to add bulk solve tasks to a pull queue drained in batches by
+# /solve_batch. Interactive solves always use their push queue.
+SOLVE_QUEUE_MODE = 'push'
+PULL_QUEUE_NAME = 'solve-pull'
+# Number of tasks leased at once by the batch worker.
+BATCH_SIZE = 32
+# How long each /solve_batch request keeps leasing tasks.
+BATCH_WORKER_SECONDS = 50
+# Number of times a pull task that failed is leased again before its solve is
+# answered with the error image.
+BATCH_TASK_RETRY_LIMIT = 5
+# Whether the batch worker overlaps fetching, solving and uploading the images
+# of a batch with a pipeline of thread pools.
+BATCH_PIPELINE = True
+
+# Number of worker processes that parse and solve images for a solver
+# instance: None for one per core, or 0 to solve in the request thread.
+CPU_POOL_PROCESSES = None
+
+# Once a newly queued solve is estimated to wait longer than this, /stage sends
+# small interactive images to /solve_sync and asks clients to retry the others
+# later.
+MAX_QUEUE_WAIT_SECONDS = {INTERACTIVE: 20, BULK: 300}
+
+# Search budget of each solver endpoint, as the most search nodes and seconds
+# spent on one puzzle (None for no limit). Puzzles that exhaust it are answered
+# with the error image.
+SYNC_SOLVE_BUDGET = (5000, 1.0)
+ASYNC_SOLVE_BUDGET = (50000, 10.0)
+BATCH_SOLVE_BUDGET = (10000, 2.0)
@@ -0,0 +1,196 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parses and solves sudoku puzzle images in a pool of worker processes.
+
+Request threads of a threadsafe instance share one interpreter, so the pure
+Python parts of parsing and solving contend for the GIL. Running them in worker
+processes lets throughput scale with the number of cores. Each worker process
+trains its OCR model once. Images are passed to the workers through shared
+memory slots; the stringified puzzle and the jpeg-encoded solution come back.
+"""
+
+import ctypes
+import logging
+import multiprocessing
+from multiprocessing import sharedctypes
+import Queue
+import threading
+
+import sudoku_core
+import sudoku_image_parser
+import sudoku_solver
+
+
+# Images larger than this are sent to the workers by pickling instead.
+SLOT_BYTES = 2 * 1024 * 1024
+# Number of shared memory slots per worker process.
+SLOTS_PER_PROCESS = 2
+
+# Errors raised by a worker, re-raised by CpuPool.solve(), by the name they
+# are sent back under. Subclasses of these, e.g. UnicodeDecodeError, are sent
+# back under the name of the first class they are an instance of.
+_ERRORS = (
+    ('ImageError', sudoku_image_parser.ImageError),
+    ('ContradictionError', sudoku_solver.ContradictionError),
+    ('BudgetExceeded', sudoku_solver.BudgetExceeded),
+    ('IndexError', IndexError),
+    ('ValueError', ValueError),
+)
+_ERROR_CLASSES = dict(_ERRORS)
+
+# State of a worker process.
+_model = None
+_slots = None
+
+
+def _init_worker(slots):
+    """Initialize a worker process: train its model and keep the slots."""
+
+    global _model, _slots
+    _model = sudoku_image_parser.SudokuImageParser().model
+    _slots = slots
+
+
+def _solve(image_data, budget=(None, None)):
+    """Parse and solve an image in a worker process.
+
+    Args:
+        image_data: The data of the image as a string.
+        budget: The search budget, as a (max_nodes, max_seconds) tuple.
+
+    Returns:
+        A tuple of the stringified puzzle, the jpeg-encoded solution image and
+        None, or of None, None and the (name, message, search counters) of the
+        error raised.
+    """
+
+    parser = sudoku_image_parser.SudokuImageParser(model=_model)
+    try:
+        puzzle = parser.parse(image_data)
+        solution = sudoku_solver.SudokuSolver(*budget).solve(puzzle)
+        image_solution = parser.draw_solution(solution)
+        return (puzzle, parser.convert_to_jpeg(image_solution).tostring(),
+                None)
+    except tuple(_ERROR_CLASSES.values()) as e:
+        stats = getattr(e, 'stats', None)
+        return None, None, (_error_name(e), str(e), stats and stats.as_dict())
+
+
+def _error_name(error):
+    """Return the name under which a worker sends back an error."""
+
+    for name, error_class in _ERRORS:
+        if isinstance(error, error_class):
+            return name
+    return error.__class__.__name__
+
+
+def _solve_slot(slot, size, budget):
+    """Parse and solve the image in the given shared memory slot."""
+
+    return _solve(_slots[slot][:size], budget)
+
+
+class CpuPool(object):
+    """A pool of worker processes that parse and solve puzzle images.
+
+    Attributes:
+        processes: The number of worker processes.
+    """
+
+    def __init__(self, processes=None, slot_bytes=SLOT_BYTES):
+        """Initialize the CpuPool, and start its worker processes.
+
+        Args:
+            processes: Number of worker processes; one per core if None.
+            slot_bytes: Size of each shared memory slot.
+        """
+
+        self.processes = processes or multiprocessing.cpu_count()
+        self._slot_bytes = slot_bytes
+        self._slots = [sharedctypes.RawArray(ctypes.c_char, slot_bytes)
+                       for _ in xrange(self.processes * SLOTS_PER_PROCESS)]
+        self._free_slots = Queue.Queue()
+        for slot in xrange(len(self._slots)):
+            self._free_slots.put(slot)
+        self._pool = multiprocessing.Pool(
+                self.processes, _init_worker, (self._slots,))
+
+    def solve(self, image_data, budget=(None, None)):
+        """Parse and solve a puzzle image in a worker process.
+
+        Blocks until a worker is available and has finished.
+
+        Args:
+            image_data: The data of the image as a string.
+            budget: The search budget, as a (max_nodes, max_seconds) tuple.
+
+        Returns:
+            A tuple of the stringified puzzle and the jpeg-encoded solution
+            image as a string.
+
+        Raises:
+            The ImageError, ContradictionError, BudgetExceeded, IndexError or
+            ValueError raised while parsing or solving the puzzle.
+        """
+
+        if len(image_data) > self._slot_bytes:
+            puzzle, image_solution, error = self._pool.apply(
+                    _solve, (image_data, budget))
+        else:
+            slot = self._free_slots.get()
+            try:
+                ctypes.memmove(self._slots[slot], image_data, len(image_data))
+                puzzle, image_solution, error = self._pool.apply(
+                        _solve_slot, (slot, len(image_data), budget))
+            finally:
+                self._free_slots.put(slot)
+        if error:
+            name, message, stats = error
+            if name == 'BudgetExceeded':
+                raise sudoku_solver.BudgetExceeded(
+                        message, sudoku_core.SearchStats.from_dict(stats))
+            # An error not in _ERRORS is re-raised as a RuntimeError.
+            raise _ERROR_CLASSES.get(name, RuntimeError)(message)
+        return puzzle, image_solution
+
+    def close(self):
+        """Stop the worker processes."""
+
+        self._pool.close()
+        self._pool.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(processes=None):
+    """Return the CpuPool of this process, starting it on first use.
+
+    The solver module starts it when its instance starts, from /_ah/start, as
+    forking the worker processes while other request threads run could copy
+    locks they hold into the workers.
+
+    Args:
+        processes: Number of worker processes; one per core if None.
+    """
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CpuPool(processes)
+            logging.info("started %d solver processes", _pool.processes)
+        return _pool
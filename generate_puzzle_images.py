@@ -0,0 +1,330 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Renders sudoku puzzles as synthetic photos, with their ground truth.
+
+Each puzzle is drawn on paper with a randomly chosen font, digit weight and
+grid line widths, then warped in perspective onto a background, lit with a
+gradient, blurred, noised and compressed as JPEG. The images are written to an
+output directory along with expected.json, which maps each image's file name
+to its puzzle in the format benchmark_pipeline.py reads:
+
+    python generate_puzzle_images.py -n 5000 -p -1 -o /tmp/puzzles
+    python benchmark_pipeline.py --originals-only \
+        --expected /tmp/puzzles/expected.json
+
+Puzzles are random, or read from files of 81-character grids, one per line.
+Every image is drawn from its own seed, so a run is reproducible whatever the
+number of worker processes.
+
+Usage: python generate_puzzle_images.py [-n COUNT] [-p PROCESSES] [-o DIR]
+                                        [--seed SEED] [FILE ...]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import sudoku_core
+from solve_grids import read_grids
+
+
+PHOTO_WIDTH = 640
+PHOTO_HEIGHT = 480
+# Side of the drawn grid, and the paper margin around it, in pixels.
+GRID_SIDE = 450
+MARGIN = 24
+FONTS = (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX,
+         cv2.FONT_HERSHEY_COMPLEX, cv2.FONT_HERSHEY_TRIPLEX,
+         cv2.FONT_HERSHEY_PLAIN)
+# Range of the number of givens of random puzzles.
+MIN_GIVENS = 22
+MAX_GIVENS = 36
+# Number of images sent to a worker process at once.
+CHUNK_SIZE = 16
+EXPECTED_FILENAME = 'expected.json'
+
+# A solution that random solutions are shuffled from.
+_BASE_SOLUTION = sudoku_core.solve('0' * 81)
+
+
+def random_solution(rng):
+    """Return a random solution, shuffling the digits, the rows within bands,
+    the bands, the columns within stacks and the stacks of a solved grid."""
+
+    digits = range(1, 10)
+    rng.shuffle(digits)
+    rows = [band * 3 + row for band in rng.sample(xrange(3), 3)
+            for row in rng.sample(xrange(3), 3)]
+    cols = [stack * 3 + col for stack in rng.sample(xrange(3), 3)
+            for col in rng.sample(xrange(3), 3)]
+    transpose = rng.random() < 0.5
+    cells = []
+    for r in rows:
+        for c in cols:
+            cell = c * 9 + r if transpose else r * 9 + c
+            cells.append(str(digits[int(_BASE_SOLUTION[cell]) - 1]))
+    return ''.join(cells)
+
+
+def random_puzzle(rng, givens=None):
+    """Return a random puzzle with the given number of givens, or a random
+    number of them, as a string of 81 digits with blanks as '0'."""
+
+    if givens is None:
+        givens = rng.randint(MIN_GIVENS, MAX_GIVENS)
+    solution = random_solution(rng)
+    kept = set(rng.sample(xrange(81), givens))
+    return ''.join(solution[cell] if cell in kept else '0'
+                   for cell in xrange(81))
+
+
+class Style(object):
+    """The randomly chosen look of one synthetic photo.
+
+    Attributes:
+        font: The cv2 Hershey font of the digits.
+        font_scale: The digits' font scale.
+        digit_weight: The digits' stroke thickness.
+        thin_line: Width of the lines between cells.
+        thick_line: Width of the lines between boxes and around the grid.
+        ink: BGR color of the grid and digits.
+        paper: BGR color of the paper.
+        background: BGR color of the surface under the paper.
+        corners: The paper's four corners in the photo, clockwise from the top
+            left.
+        light: Strength of the lighting gradient, from 0 for even lighting.
+        light_angle: Direction of the lighting gradient, in radians.
+        blur: Size of the Gaussian blur kernel, or 0 for none.
+        noise: Standard deviation of the pixel noise.
+        quality: JPEG quality.
+    """
+
+    def __init__(self, rng):
+        """Choose a Style with the random.Random rng."""
+
+        self.font = rng.choice(FONTS)
+        if self.font == cv2.FONT_HERSHEY_PLAIN:
+            self.font_scale = rng.uniform(2.4, 3.2)
+        else:
+            self.font_scale = rng.uniform(1.1, 1.6)
+        self.digit_weight = rng.randint(2, 4)
+        self.thin_line = rng.randint(1, 2)
+        self.thick_line = rng.randint(3, 5)
+        shade = rng.randint(0, 60)
+        self.ink = (shade, shade, shade)
+        self.paper = tuple(rng.randint(200, 255) for _ in xrange(3))
+        self.background = tuple(rng.randint(20, 140) for _ in xrange(3))
+        self.corners = self._random_corners(rng)
+        self.light = rng.uniform(0, 0.5)
+        self.light_angle = rng.uniform(0, 2 * np.pi)
+        self.blur = rng.choice((0, 0, 3, 5))
+        self.noise = rng.uniform(0, 12)
+        self.quality = rng.randint(30, 95)
+
+    @staticmethod
+    def _random_corners(rng):
+        """Return the corners of a slightly rotated and skewed paper."""
+
+        side = rng.uniform(0.8, 1.0) * PHOTO_HEIGHT
+        center_x = PHOTO_WIDTH / 2.0 + rng.uniform(-40, 40)
+        center_y = PHOTO_HEIGHT / 2.0 + rng.uniform(-10, 10)
+        angle = np.radians(rng.uniform(-6, 6))
+        cos, sin = np.cos(angle), np.sin(angle)
+        corners = []
+        for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+            x = x * side / 2 + rng.uniform(-0.06, 0.06) * side
+            y = y * side / 2 + rng.uniform(-0.06, 0.06) * side
+            corners.append((center_x + x * cos - y * sin,
+                            center_y + x * sin + y * cos))
+        return corners
+
+
+def draw_grid(puzzle, style, rng):
+    """Draw a puzzle flat on paper.
+
+    Args:
+        puzzle: String of 81 digits, with blanks as '0' or '.'.
+        style: The Style to draw it in.
+        rng: random.Random used to jitter the digits within their cells.
+
+    Returns:
+        The numpy.ndarray of the paper.
+    """
+
+    side = GRID_SIDE + 2 * MARGIN
+    paper = np.empty((side, side, 3), np.uint8)
+    paper[:] = style.paper
+    cell = GRID_SIDE / 9.0
+    for i in xrange(10):
+        width = style.thick_line if i % 3 == 0 else style.thin_line
+        offset = MARGIN + int(round(i * cell))
+        cv2.line(paper, (offset, MARGIN), (offset, MARGIN + GRID_SIDE),
+                 style.ink, width)
+        cv2.line(paper, (MARGIN, offset), (MARGIN + GRID_SIDE, offset),
+                 style.ink, width)
+    for index, digit in enumerate(puzzle):
+        if digit in '0.':
+            continue
+        (width, height), _ = cv2.getTextSize(digit, style.font,
+                                             style.font_scale,
+                                             style.digit_weight)
+        x = MARGIN + (index % 9) * cell + (cell - width) / 2
+        y = MARGIN + (index // 9) * cell + (cell + height) / 2
+        cv2.putText(paper, digit,
+                    (int(x + rng.uniform(-3, 3)), int(y + rng.uniform(-3, 3))),
+                    style.font, style.font_scale, style.ink,
+                    style.digit_weight, cv2.CV_AA)
+    return paper
+
+
+def render(puzzle, seed):
+    """Render a puzzle as a synthetic photo.
+
+    Args:
+        puzzle: String of 81 digits, with blanks as '0' or '.'.
+        seed: Seed of all the random choices of the image.
+
+    Returns:
+        The JPEG data of the photo, as a string.
+    """
+
+    rng = random.Random(seed)
+    noise_rng = np.random.RandomState(rng.randint(0, 2 ** 31 - 1))
+    style = Style(rng)
+    paper = draw_grid(puzzle, style, rng)
+
+    photo = np.empty((PHOTO_HEIGHT, PHOTO_WIDTH, 3), np.uint8)
+    photo[:] = style.background
+    side = paper.shape[0]
+    matrix = cv2.getPerspectiveTransform(
+            np.float32([(0, 0), (side, 0), (side, side), (0, side)]),
+            np.float32(style.corners))
+    cv2.warpPerspective(paper, matrix, (PHOTO_WIDTH, PHOTO_HEIGHT), photo,
+                        cv2.INTER_LINEAR, cv2.BORDER_TRANSPARENT)
+
+    ys, xs = np.mgrid[0:PHOTO_HEIGHT, 0:PHOTO_WIDTH]
+    ramp = (xs * np.cos(style.light_angle) + ys * np.sin(style.light_angle))
+    ramp = (ramp - ramp.min()) / (ramp.max() - ramp.min())
+    light = 1 - style.light * ramp
+    image = photo.astype(np.float32) * light[:, :, np.newaxis]
+    if style.blur:
+        image = cv2.GaussianBlur(image, (style.blur, style.blur), 0)
+    image += noise_rng.normal(0, style.noise, image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    _, data = cv2.imencode('.jpg', image,
+                           [cv2.IMWRITE_JPEG_QUALITY, style.quality])
+    return data.tostring()
+
+
+def _render_file(job):
+    """Render a puzzle to a file in a worker process.
+
+    Args:
+        job: Tuple of the image's file name, puzzle, seed and output
+            directory.
+
+    Returns:
+        The file name and puzzle.
+    """
+
+    filename, puzzle, seed, output_dir = job
+    with open(os.path.join(output_dir, filename), 'wb') as f:
+        f.write(render(puzzle, seed))
+    return filename, puzzle
+
+
+def _valid_grids(lines):
+    """Yield the lines that are grids of 81 digits or '.', skipping others.
+
+    draw_grid() places each character in a cell, so a line of another length
+    or with other characters would be drawn wrongly and recorded as expected.
+    """
+
+    for line in lines:
+        if len(line) == 81 and all(c in '0123456789.' for c in line):
+            yield line
+        else:
+            sys.stderr.write('Skipping a line that is not 81 digits or '
+                             '\'.\': %r\n' % line)
+
+
+def _jobs(puzzles, seed, output_dir):
+    """Yield the render job of each puzzle."""
+
+    for index, puzzle in enumerate(puzzles):
+        yield ('%06d.jpg' % index, puzzle, '%d-%d' % (seed, index), output_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Render sudoku puzzles as synthetic photos.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='files of grids to render, one per line; random '
+                        'puzzles if none')
+    parser.add_argument('-n', '--count', type=int, default=1000,
+                        help='number of random puzzles to render')
+    parser.add_argument('-o', '--output', default='synthetic_puzzles',
+                        help='directory to write the images to')
+    parser.add_argument('-p', '--processes', type=int, default=0,
+                        help='number of worker processes; 0 renders in this '
+                        'process, -1 uses one per core')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the puzzles and images')
+    args = parser.parse_args(argv)
+
+    if args.files:
+        lines = read_grids([open(name) for name in args.files])
+        puzzles = _valid_grids(lines)
+    else:
+        rng = random.Random(args.seed)
+        puzzles = (random_puzzle(rng) for _ in xrange(args.count))
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    jobs = _jobs(puzzles, args.seed, args.output)
+
+    processes = args.processes
+    if processes < 0:
+        processes = multiprocessing.cpu_count()
+    pool = None
+    if processes:
+        pool = multiprocessing.Pool(processes)
+        rendered = pool.imap_unordered(_render_file, jobs, CHUNK_SIZE)
+    else:
+        rendered = (_render_file(job) for job in jobs)
+
+    start = time.time()
+    expected = dict(rendered)
+    if pool:
+        pool.close()
+        pool.join()
+    with open(os.path.join(args.output, EXPECTED_FILENAME), 'w') as f:
+        json.dump(expected, f, indent=0, sort_keys=True)
+        f.write('\n')
+    seconds = time.time() - start
+    sys.stderr.write('Rendered %d images in %.2f secs (%.0f per minute).\n' % (
+            len(expected), seconds, 60 * len(expected) / max(seconds, 1e-6)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
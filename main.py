@@ -14,15 +14,16 @@
 
 """Managed VMs sample application using OpenCV, App Engine Modules, and Task Queues."""
 
-import base64
 import jinja2
 import json
 import logging
 import os
+import time
 import webapp2
 
-from google.appengine.api import taskqueue
-
+import config
+import results
+import staging
 import utils
 
 
@@ -30,14 +31,6 @@ JINJA_ENVIRONMENT = jinja2.Environment(
     loader=jinja2.FileSystemLoader(os.path.dirname(__file__)),
     extensions=['jinja2.ext.autoescape'])
 
-def decode_if_needed(data):
-    if data.startswith('data') and 'base64' in data:
-        # remove data URL prefixes
-        data = data.split('base64,', 1)[1]
-        data = base64.standard_b64decode(data)
-    return data
-
-
 class MainHandler(webapp2.RequestHandler):
     """Handles requests to the main page, which supports video capture of a puzzle
     to be solved."""
@@ -64,16 +57,6 @@ class SolveStage(webapp2.RequestHandler):
     file at a specified URL if the binary input is not given.
     Launches a task queue task, run on a VM backend, to solve the given puzzle.
     """
-    api_url = 'https://storage.googleapis.com'
-
-    def generate_error_response(self, filename, solved_url):
-        # We got an error, so we'll copy an error message image to the GCS file
-        # indicated to contain the result.
-        utils.copy_error_image(filename)
-        # respond to the client, indicating the URL to which the result has
-        # been written.
-        resp = {'status': 'ERROR', 'solved_url' : solved_url}
-        return json.dumps(resp)
 
     def post(self):
         """Handles the post request with the sudoku image to solve.
@@ -81,60 +64,67 @@ class SolveStage(webapp2.RequestHandler):
         file at a specified URL if the binary input is not given.
         Launches a task queue task, run on a VM backend, to solve the given puzzle.
         Returns a JSON message to the client, which includes a URL that will contain
-        the result.
+        the result.  The 'request_class' parameter, 'interactive' or 'bulk'
+        (the default), chooses the task queue.  If the task queue is backed up,
+        the client is instead told to post the image to the synchronous solver,
+        or to retry later.
         """
 
-        # generate a URL to which the result will be written
-        filename = utils.create_fname('jpg')  # A new GCS-formatted filename.
-        # based on the filename, the results will show up at this URL.
-        solved_url = self.api_url + filename
         image_data = self.request.get('sudoku')
         image_url = ''
-        # if we got image data, write it to a GCS file and generate a URL
         if image_data:
-            image_data = decode_if_needed(image_data)
-            gcs_file = utils.create_png_file(image_data)
-            image_url = self.api_url + gcs_file
+            image_data = utils.decode_if_needed(image_data)
         else:
             # otherwise, try to get the image from the default URL in the form
             logging.info("did not get image data from form submit")
             image_url = self.request.get('sudoku_url')
-        if not image_url:
-            logging.warn("could not generate image url")
-            resp = self.generate_error_response(filename, solved_url)
-            self.response.headers['Content-Type'] = 'application/json'
-            self.response.write(resp)
-            return
-        logging.info("using image url: %s", image_url)
-        # create a task to solve the puzzle.  The handler will be routed to a
-        # Managed VM.
-        try:
-            # Create a Task Queue task to parse and solve the puzzle.
-            # As task parameters, indicate the URL containing the image to solve, and
-            # the GCS filename to which to write the solution image.
-            task = taskqueue.Task(url='/solve_async',
-                           method='POST',
-                           params={'image_url': image_url,
-                                   'filename' : filename})
-            # add the task to the default task queue. (Alternately, you could define a separate
-            # dedicated task queue for this purpose).
-            taskqueue.Queue().add(task)
-            # Respond to the client, indicating the URL to which the solution will
-            # be written.
-            resp = {'status': 'OK',
-                    'solved_url' : solved_url}
-            self.response.headers['Content-Type'] = 'application/json'
-            self.response.write(json.dumps(resp))
-
-        except (taskqueue.UnknownQueueError, taskqueue.TransientError):
-            logging.exception("issue adding task to queue")
-            resp = self.generate_error_response(filename, solved_url)
-            self.response.headers['Content-Type'] = 'application/json'
-            self.response.write(resp)
+        request_class = self.request.get('request_class')
+        if request_class not in config.SOLVE_QUEUES:
+            request_class = config.BULK
+        backpressure = staging.BACKPRESSURE[request_class]
+        resp = staging.stage_solve(image_data=image_data, image_url=image_url,
+                                   request_class=request_class,
+                                   backpressure=backpressure)
+        if resp['status'] == 'BUSY':
+            self.response.status = 503
+            self.response.headers['Retry-After'] = str(resp['retry_after'])
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(resp))
+
+class ResultStatus(webapp2.RequestHandler):
+    """Handles requests for the status of an asynchronous solve.  Blocks until the
+    solver signals that the result has been written, or until a timeout."""
+
+    def get(self, result_id):
+        """Returns a JSON message with the status of the result and its URL.
+        The status is PENDING if the result was not written before the timeout,
+        in which case the client should ask again.
+        """
+
+        resp = results.wait_for_result(result_id, config.RESULT_WAIT_SECONDS)
+        if not resp:
+            resp = {'status': results.STATUS_PENDING}
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(resp))
+
+
+class CleanupResults(webapp2.RequestHandler):
+    """Handler deleting expired completion records of asynchronous solves.  Run
+    from cron."""
+
+    def get(self):
+        """Delete expired records until none are left or
+        config.RESULT_CLEANUP_SECONDS have passed."""
+
+        deleted = results.delete_expired(
+                time.time() + config.RESULT_CLEANUP_SECONDS)
+        logging.info("deleted %d expired results", deleted)
 
 
 APP = webapp2.WSGIApplication([
     ('/', MainHandler),
     ('/upload', UploadImage),
     ('/stage', SolveStage),
+    (r'/result/([\w-]+)', ResultStatus),
+    ('/cleanup_results', CleanupResults),
 ], debug=True)
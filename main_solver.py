@@ -15,16 +15,26 @@
 """Managed VMs sample application using OpenCV, App Engine Modules, and Task Queues."""
 
 import base64
+import json
 import logging
 import os
+import threading
+import time
 import jinja2
 import webapp2
 
 from google.appengine.api import modules
 from google.appengine.ext import ndb
 from google.appengine.api import runtime
+from google.appengine.api import taskqueue
 from google.appengine.api import urlfetch
 
+import admission
+import batch_worker
+import config
+import cpu_pool
+import results
+import staging
 import sudoku_image_parser
 import sudoku_solver
 import utils
@@ -34,68 +44,295 @@ JINJA_ENVIRONMENT = jinja2.Environment(
     loader=jinja2.FileSystemLoader(os.path.dirname(__file__)),
     extensions=['jinja2.ext.autoescape'])
 
+# Shared by all request threads of this (threadsafe) instance.
+SYNC_POLICY = admission.SyncAdmissionPolicy(config.SYNC_MAX_IMAGE_BYTES,
+                                            config.SYNC_MAX_IN_FLIGHT)
+
+# Per-stage timings of SolveAsync, published for the frontend's backpressure
+# controller every TIMINGS_PUBLISH_SECONDS.
+TIMINGS = admission.StageTimings()
+TIMINGS_PUBLISH_SECONDS = 5
+_timings_published = 0
+
+
+def _record_timing(stage, start):
+    """Record the time taken by a stage that started at the given time."""
+
+    global _timings_published
+    now = time.time()
+    TIMINGS.record(stage, now - start)
+    if now - _timings_published > TIMINGS_PUBLISH_SECONDS:
+        _timings_published = now
+        staging.publish_timings(TIMINGS)
+
 
 class SolverBase(webapp2.RequestHandler):
 
     api_url = 'https://storage.googleapis.com'
 
-    def _solved_puzzle_image(self, stringified_puzzle):
-        solver = sudoku_solver.SudokuSolver()
+    def _solved_puzzle_image(self, stringified_puzzle, budget):
+        solver = sudoku_solver.SudokuSolver(*budget)
         solution = ''
         solution = solver.solve(stringified_puzzle)
         image_solution = self.parser.draw_solution(solution)
         image_solution = self.parser.convert_to_jpeg(image_solution)
         return image_solution
 
+    def _solve_image(self, image_data, budget):
+        """Parse and solve the puzzle image, and return the jpeg-encoded solution
+        image as a string.  Runs in the CPU pool's worker processes unless
+        config.CPU_POOL_PROCESSES is 0.  budget is the search budget, as a
+        (max_nodes, max_seconds) tuple.
+        """
+
+        if config.CPU_POOL_PROCESSES != 0:
+            pool = cpu_pool.get_pool(config.CPU_POOL_PROCESSES)
+            stringified_puzzle, image_solution = pool.solve(image_data, budget)
+            logging.info("stringified puzzle: %s", stringified_puzzle)
+            return image_solution
+        self.parser = sudoku_image_parser.SudokuImageParser()
+        stringified_puzzle = self.parser.parse(image_data)
+        logging.info("stringified puzzle: %s", stringified_puzzle)
+        return self._solved_puzzle_image(stringified_puzzle,
+                                         budget).tostring()
+
+
+class SolveSync(SolverBase):
+    """Handler to parse and solve the given sudoku puzzle image in-process, and
+    return the solution image directly.  Images that are too large, or that
+    arrive while the instance is busy, are staged to the task queue instead.
+    """
+
+    def post(self):
+        """Parse and solve the posted sudoku puzzle image.
+        Responds with the annotated JPEG if the image was solved synchronously,
+        or with the same JSON message as /stage if it was queued.
+        """
+
+        image_data = utils.decode_if_needed(self.request.get('sudoku'))
+        if not image_data:
+            logging.info("no image data")
+            self.abort(400)
+        if not SYNC_POLICY.try_admit(len(image_data)):
+            logging.info("queueing image of %d bytes", len(image_data))
+            resp = staging.stage_solve(image_data=image_data,
+                                       request_class=config.INTERACTIVE)
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps(resp))
+            return
+        try:
+            image_solution = self._solve_image(image_data,
+                                               config.SYNC_SOLVE_BUDGET)
+        except (IndexError, ValueError, sudoku_image_parser.ImageError,
+                sudoku_solver.ContradictionError,
+                sudoku_solver.BudgetExceeded) as e:
+            logging.debug(e)
+            image_solution = utils.read_error_image()
+        finally:
+            SYNC_POLICY.release()
+        self.response.headers['Content-Type'] = 'image/jpeg'
+        self.response.write(image_solution)
+
 
 class SolveAsync(SolverBase):
     """Handler to parse and solve the given sudoku puzzle image, and write the result to a
     GCS file.  Run as a task handler.
     """
 
+    def _write_error(self, filename):
+        """Write the error image as the result, and signal completion."""
+
+        utils.copy_error_image(filename)
+        results.mark_done(filename, self.api_url + filename,
+                          status=results.STATUS_ERROR)
+
+    def _is_last_attempt(self):
+        """Return whether the task queue won't retry this task if it fails."""
+
+        headers = self.request.headers
+        queue_name = headers.get('X-AppEngine-QueueName')
+        retry_count = int(headers.get('X-AppEngine-TaskRetryCount', 0))
+        for request_class, name in config.SOLVE_QUEUES.items():
+            if name == queue_name:
+                return (retry_count >=
+                        config.SOLVE_TASK_RETRY_LIMITS[request_class])
+        return True
+
     def post(self):
         """Parse and solve the given sudoku puzzle image, and write the result to a known GCS
-        file.
+        file.  The image is either given inline as the request body, or fetched from
+        the 'image_url' parameter.
         """
 
         image_url = self.request.get('image_url')
         filename = self.request.get('filename')
         image_data = None
+        start = time.time()
         try:
             if image_url:
                 logging.info("image url: %s", image_url)
                 result = urlfetch.fetch(image_url)
                 if result.status_code == 200:
                     image_data = result.content
+            elif self.request.content_type == 'application/octet-stream':
+                # The image was small enough to be sent inline as the task
+                # payload.
+                logging.info("using inline image data")
+                image_data = self.request.body
             else:
                 logging.info('did not get image url...')
         except:
             logging.exception("issue fetching url data")
         if not image_data:
             logging.info("no image data")
-            utils.copy_error_image(filename)
+            self._write_error(filename)
             return
 
-        self.parser = sudoku_image_parser.SudokuImageParser()
-        stringified_puzzle = ''
-        try:
-            stringified_puzzle = self.parser.parse(image_data)
-            logging.info("stringified puzzle: %s", stringified_puzzle)
-        except (IndexError, sudoku_image_parser.ImageError) as e:
-            logging.debug(e)
-            utils.copy_error_image(filename)
-            return
+        _record_timing('fetch', start)
+
         try:
-            image_solution = self._solved_puzzle_image(stringified_puzzle)
-            gcs_file = utils.create_jpg_file(filename, image_solution.tostring())
+            start = time.time()
+            image_solution = self._solve_image(image_data,
+                                               config.ASYNC_SOLVE_BUDGET)
+            _record_timing('solve', start)
+            start = time.time()
+            gcs_file = utils.create_jpg_file(filename, image_solution)
             logging.debug("url: %s%s", self.api_url, gcs_file)
+            results.mark_done(filename, self.api_url + gcs_file)
+            _record_timing('upload', start)
             return
-        except (sudoku_solver.ContradictionError, ValueError) as e:
+        except (IndexError, ValueError, sudoku_image_parser.ImageError,
+                sudoku_solver.ContradictionError,
+                sudoku_solver.BudgetExceeded) as e:
             logging.debug(e)
-            utils.copy_error_image(filename)
+            self._write_error(filename)
             return
+        except Exception:
+            # Let the task queue retry the solve, unless this was its last
+            # attempt, so that the client always gets a final result.
+            logging.exception("unexpected error solving %s", filename)
+            if not self._is_last_attempt():
+                raise
+            self._write_error(filename)
+
+
+def _fetch_image(image_url):
+    """Return the image data at the given URL, or None if it can't be fetched."""
+
+    try:
+        result = urlfetch.fetch(image_url)
+        if result.status_code == 200:
+            return result.content
+    except:
+        logging.exception("issue fetching url data")
+    return None
+
+
+def _write_result(filename, image_solution):
+    """Write a solution image to GCS, or the error image if image_solution is
+    None.
+
+    Returns:
+        A (filename, solved_url, status) tuple, for results.mark_done_multi().
+    """
+
+    solved_url = SolverBase.api_url + filename
+    if image_solution:
+        utils.create_jpg_file(filename, image_solution)
+        return filename, solved_url, results.STATUS_DONE
+    utils.copy_error_image(filename)
+    return filename, solved_url, results.STATUS_ERROR
+
+
+# The worker run by SolveBatch in this instance, created by its first request.
+_batch_worker = None
+# Held by the SolveBatch request running _batch_worker.
+_batch_worker_lock = threading.Lock()
+
+
+def _get_batch_worker():
+    """Return the batch worker of this instance, creating it if needed.
+
+    The worker, and the OCR models it trains, are kept for the next cron
+    requests.
+    """
+
+    global _batch_worker
+    if _batch_worker is None:
+        args = (taskqueue.Queue(config.PULL_QUEUE_NAME),
+                _fetch_image,
+                _write_result,
+                results.mark_done_multi)
+        if config.BATCH_PIPELINE:
+            pool = None
+            if config.CPU_POOL_PROCESSES != 0:
+                pool = cpu_pool.get_pool(config.CPU_POOL_PROCESSES)
+            _batch_worker = batch_worker.PipelinedBatchSolveWorker(
+                    *args, batch_size=config.BATCH_SIZE, cpu_pool=pool,
+                    budget=config.BATCH_SOLVE_BUDGET,
+                    retry_limit=config.BATCH_TASK_RETRY_LIMIT)
+        else:
+            _batch_worker = batch_worker.BatchSolveWorker(
+                    *args, batch_size=config.BATCH_SIZE,
+                    budget=config.BATCH_SOLVE_BUDGET,
+                    retry_limit=config.BATCH_TASK_RETRY_LIMIT)
+    return _batch_worker
+
+
+class SolveBatch(webapp2.RequestHandler):
+    """Handler that leases batches of solve tasks from the pull queue, and solves
+    them.  Run from cron when config.SOLVE_QUEUE_MODE is 'pull'.
+    """
+
+    def get(self):
+        """Drain the pull queue until it is empty or config.BATCH_WORKER_SECONDS
+        have passed.
+
+        Returns at once if another request of this instance is still draining
+        it.
+        """
+
+        if not _batch_worker_lock.acquire(False):
+            logging.info("the batch worker is already running")
+            return
+        try:
+            worker = _get_batch_worker()
+            processed = worker.run(time.time() + config.BATCH_WORKER_SECONDS)
+        finally:
+            _batch_worker_lock.release()
+        logging.info("processed %d tasks", processed)
+
+
+class SolveBatchStats(webapp2.RequestHandler):
+    """Handler reporting the queue depth of each stage of this instance's
+    pipelined batch worker, for sizing the solver VMs."""
+
+    def get(self):
+        """Returns the stage statistics as JSON."""
+
+        stats = {}
+        worker = _batch_worker
+        if worker and hasattr(worker, 'pipeline'):
+            stats = worker.pipeline.stats()
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(stats))
+
+
+class StartInstance(webapp2.RequestHandler):
+    """Handler of the start request App Engine sends to a new instance before
+    any other request."""
+
+    def get(self):
+        """Start the CPU pool, unless config.CPU_POOL_PROCESSES is 0."""
+
+        if config.CPU_POOL_PROCESSES != 0:
+            cpu_pool.get_pool(config.CPU_POOL_PROCESSES)
 
 
 APP = webapp2.WSGIApplication([
-    ('/solve_async', SolveAsync)
+    ('/solve_async', SolveAsync),
+    ('/solve_sync', SolveSync),
+    ('/solve_batch', SolveBatch),
+    ('/solve_batch/stats', SolveBatchStats),
+    ('/_ah/start', StartInstance),
 ], debug=True)
@@ -15,6 +15,7 @@
 """Managed VMs sample application using OpenCV."""
 
 
+import json
 import logging
 import os
 
@@ -24,6 +25,71 @@ import webapp2
 import sudoku_solver
 
 
+# Search budget of each endpoint, as the most search nodes and seconds spent on
+# one puzzle (None for no limit).
+SOLVE_BUDGET = (50000, 5.0)
+BATCH_SOLVE_BUDGET = (10000, 1.0)
+
+# Solvers shared by all requests; the batch solver is shared by all the grids
+# of a batch.
+SOLVER = sudoku_solver.SudokuSolver(*SOLVE_BUDGET)
+BATCH_SOLVER = sudoku_solver.SudokuSolver(*BATCH_SOLVE_BUDGET)
+NDJSON_TYPE = 'application/x-ndjson'
+
+
+def solve_grid(index, puzzle):
+    """Solve one grid of a batch.
+
+    Args:
+        index: Position of the grid in the batch.
+        puzzle: The grid as a string, as for the puzzle parameter of GET.
+
+    Returns:
+        A dict with the index, the puzzle, and either the solution or an error
+        message.
+    """
+
+    result = {'index': index, 'puzzle': puzzle}
+    try:
+        if not isinstance(puzzle, basestring):
+            raise ValueError('Grid is not a string.')
+        result['solution'] = BATCH_SOLVER.solve(puzzle)
+    except (sudoku_solver.ContradictionError, sudoku_solver.BudgetExceeded,
+            ValueError) as e:
+        result['error'] = str(e)
+    return result
+
+
+def read_grids(request):
+    """Generate the grids of a batch request.
+
+    A JSON request body is an array of grid strings. Otherwise the body is read
+    as newline-delimited grids, each either a JSON string or a bare grid, so
+    that large batches are read one line at a time.
+
+    Raises:
+        ValueError: if a JSON body is not an array.
+    """
+
+    if request.content_type == 'application/json':
+        grids = json.loads(request.body)
+        if not isinstance(grids, list):
+            raise ValueError('Body is not a JSON array.')
+        for grid in grids:
+            yield grid
+        return
+    for line in request.body_file:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('"'):
+            try:
+                line = json.loads(line)
+            except ValueError:
+                pass
+        yield line
+
+
 class Solve(webapp2.RequestHandler):
     """Handles the post request with the sudoku image."""
 
@@ -32,10 +98,10 @@ class Solve(webapp2.RequestHandler):
 
         puzzle = self.request.get('puzzle')
         if puzzle:
-            solver = sudoku_solver.SudokuSolver()
             try:
-                solution = solver.solve(puzzle)
-            except (sudoku_solver.ContradictionError, ValueError) as e:
+                solution = SOLVER.solve(puzzle)
+            except (sudoku_solver.ContradictionError,
+                    sudoku_solver.BudgetExceeded, ValueError) as e:
                 logging.debug(e)
                 self.response.write(
                         '%s Puzzle: %s.' % (str(e), puzzle))
@@ -45,7 +111,67 @@ class Solve(webapp2.RequestHandler):
         else:
             self.response.write('No puzzle data')
 
+    def post(self):
+        """Batch solver API: solves each grid in the request body.
+
+        The results are streamed back as newline-delimited JSON, one object per
+        grid in the order of the request, with either a solution or an error.
+        """
+
+        grids = read_grids(self.request)
+        try:
+            first = next(grids, None)
+        except ValueError as e:
+            self.response.status = 400
+            self.response.write(str(e))
+            return
+        if first is None:
+            self.response.status = 400
+            self.response.write('No puzzle data')
+            return
+
+        def results():
+            yield json.dumps(solve_grid(0, first)) + '\n'
+            for index, grid in enumerate(grids, 1):
+                yield json.dumps(solve_grid(index, grid)) + '\n'
+
+        self.response.headers['Content-Type'] = NDJSON_TYPE
+        self.response.app_iter = results()
+
+
+class Hint(webapp2.RequestHandler):
+    """Handles hint requests for a puzzle being played."""
+
+    def get(self):
+        """Hint API: the next cell to fill in the puzzle, as JSON.
+
+        The puzzle parameter holds the givens, and the optional grid parameter
+        the puzzle as filled in so far.
+        """
+
+        puzzle = self.request.get('puzzle')
+        if not puzzle:
+            self.response.write('No puzzle data')
+            return
+        try:
+            snapshot = SOLVER.snapshot(puzzle)
+            hint = snapshot.next_hint(self.request.get('grid') or None)
+        except (sudoku_solver.ContradictionError,
+                sudoku_solver.BudgetExceeded, ValueError) as e:
+            logging.debug(e)
+            self.response.status = 400
+            self.response.write('%s Puzzle: %s.' % (str(e), puzzle))
+            return
+        self.response.headers['Content-Type'] = 'application/json'
+        if hint is None:
+            self.response.write(json.dumps({'solved': True}))
+        else:
+            self.response.write(json.dumps({'cell': hint.cell,
+                                            'digit': hint.digit,
+                                            'reason': hint.reason}))
+
 
 APP = webapp2.WSGIApplication([
-    ('/solve', Solve)
+    ('/solve', Solve),
+    ('/hint', Hint)
 ], debug=True)
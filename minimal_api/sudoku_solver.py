@@ -0,0 +1 @@
+../sudoku_solver.py
\ No newline at end of file
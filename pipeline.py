@@ -0,0 +1,165 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A staged pipeline of thread pools connected by bounded queues.
+
+Each stage has its own pool of threads, so that stages waiting on the network
+overlap with stages using the CPU for other items.
+"""
+
+import logging
+import Queue
+import threading
+
+
+class Stage(object):
+    """One stage of a Pipeline.
+
+    Attributes:
+        name: Name of the stage, used in its statistics.
+        func: Function applied to each item; its return value is passed to the
+            next stage.
+        threads: Number of threads running the stage.
+        queue: Bounded Queue.Queue of items waiting for the stage.
+        max_depth: The largest number of items seen waiting for the stage.
+    """
+
+    def __init__(self, name, func, threads, queue_size):
+        """Initialize the Stage object and attributes."""
+
+        self.name = name
+        self.func = func
+        self.threads = threads
+        self.queue = Queue.Queue(queue_size)
+        self.max_depth = 0
+
+    def put(self, item):
+        """Add an item to the stage's queue, blocking while it is full."""
+
+        self.queue.put(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+
+class _Failure(object):
+    """Wraps an exception raised by a stage, so later stages skip the item."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _Output(object):
+    """Collects the items leaving the last stage of a Pipeline."""
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+
+    def put(self, item):
+        self.queue.put(item)
+
+
+_DONE = object()
+
+
+class Pipeline(object):
+    """Runs items through a sequence of stages.
+
+    Attributes:
+        stages: The list of Stage objects, in order.
+    """
+
+    def __init__(self, stages):
+        """Initialize the Pipeline with a list of Stage objects."""
+
+        self.stages = stages
+
+    def map(self, items):
+        """Run each item through all the stages.
+
+        Args:
+            items: A list of the items given to the first stage.
+
+        Returns:
+            A list of the values returned by the last stage for each item, in
+            the order of items. If a stage raised an exception for an item, the
+            exception is returned instead, and later stages skip the item.
+        """
+
+        output = _Output()
+        threads = []
+        for i, stage in enumerate(self.stages):
+            if i + 1 < len(self.stages):
+                next_stage = self.stages[i + 1]
+            else:
+                next_stage = output
+            finished = [0]
+            lock = threading.Lock()
+            for _ in xrange(stage.threads):
+                thread = threading.Thread(
+                        target=self._run_stage,
+                        args=(stage, next_stage, finished, lock))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+        for index, item in enumerate(items):
+            self.stages[0].put((index, item))
+        for _ in xrange(self.stages[0].threads):
+            self.stages[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+
+        results = [None] * len(items)
+        while not output.queue.empty():
+            entry = output.queue.get()
+            if entry is _DONE:
+                continue
+            index, value = entry
+            if isinstance(value, _Failure):
+                value = value.exception
+            results[index] = value
+        return results
+
+    def stats(self):
+        """Return the current and maximum queue depth, and number of threads, of
+        each stage, as a dict keyed by stage name."""
+
+        return dict((stage.name, {'depth': stage.queue.qsize(),
+                                  'max_depth': stage.max_depth,
+                                  'threads': stage.threads})
+                    for stage in self.stages)
+
+    def _run_stage(self, stage, next_stage, finished, lock):
+        """Apply a stage's function to items from its queue until told to stop.
+        The last of the stage's threads to stop tells the next stage to stop.
+        """
+
+        while True:
+            entry = stage.queue.get()
+            if entry is _DONE:
+                break
+            index, item = entry
+            if not isinstance(item, _Failure):
+                try:
+                    item = stage.func(item)
+                except Exception as e:
+                    logging.exception("stage %s failed", stage.name)
+                    item = _Failure(e)
+            next_stage.put((index, item))
+
+        with lock:
+            finished[0] += 1
+            last = finished[0] == stage.threads
+        if last:
+            for _ in xrange(getattr(next_stage, 'threads', 1)):
+                next_stage.put(_DONE)
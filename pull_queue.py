@@ -0,0 +1,155 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Payloads of solve tasks in the pull queue, and a local stand-in for the queue.
+
+The stand-in implements the subset of the taskqueue.Queue API used by the batch
+worker and the admission controller, so that they can be run and tested without
+App Engine.
+"""
+
+import base64
+import itertools
+import json
+import threading
+import time
+
+
+def encode_payload(filename, image_data=None, image_url=None):
+    """Encode a solve task payload.
+
+    Args:
+        filename: The GCS-formatted filename to which to write the solution.
+        image_data: The image data to solve, if sent inline.
+        image_url: URL of the image to solve, if image_data is not given.
+
+    Returns:
+        The payload as a string.
+    """
+
+    payload = {'filename': filename}
+    if image_data:
+        payload['image_data'] = base64.b64encode(image_data)
+    else:
+        payload['image_url'] = image_url
+    return json.dumps(payload)
+
+
+def decode_payload(payload):
+    """Decode a solve task payload.
+
+    Args:
+        payload: A payload string created by encode_payload().
+
+    Returns:
+        A tuple of the filename, the image data (or None) and the image URL
+        (or None).
+    """
+
+    payload = json.loads(payload)
+    image_data = payload.get('image_data')
+    if image_data:
+        image_data = base64.b64decode(image_data)
+    return payload['filename'], image_data, payload.get('image_url')
+
+
+class LocalTask(object):
+    """A pull task in a LocalPullQueue.
+
+    Attributes:
+        name: The unique name of the task.
+        payload: The payload string of the task.
+        eta: Time before which the task cannot be leased.
+        retry_count: Number of times the task has been leased.
+    """
+
+    _names = itertools.count()
+
+    def __init__(self, payload):
+        """Initialize the LocalTask with the given payload."""
+
+        self.name = 'task-%d' % next(self._names)
+        self.payload = payload
+        self.eta = 0
+        self.retry_count = 0
+
+
+class LocalQueueStatistics(object):
+    """Statistics of a LocalPullQueue, like taskqueue.QueueStatistics.
+
+    Attributes:
+        tasks: Number of tasks in the queue.
+        in_flight: Number of tasks currently leased.
+    """
+
+    def __init__(self, tasks, in_flight):
+        self.tasks = tasks
+        self.in_flight = in_flight
+
+
+class LocalPullQueue(object):
+    """An in-memory stand-in for a taskqueue pull queue."""
+
+    def __init__(self):
+        """Initialize the LocalPullQueue."""
+
+        self._tasks = []
+        self._lock = threading.Lock()
+
+    def add(self, task):
+        """Add a LocalTask, or a list of them, to the queue."""
+
+        if not isinstance(task, list):
+            task = [task]
+        with self._lock:
+            self._tasks.extend(task)
+
+    def lease_tasks(self, lease_seconds, max_tasks, deadline=None):
+        """Lease up to max_tasks tasks for lease_seconds.
+
+        Leased tasks are not leased again until the lease expires, unless
+        they are deleted first.
+
+        Returns:
+            A list of LocalTask objects.
+        """
+
+        now = time.time()
+        with self._lock:
+            leased = [task for task in self._tasks if task.eta <= now]
+            leased = leased[:max_tasks]
+            for task in leased:
+                task.eta = now + lease_seconds
+                task.retry_count += 1
+        return leased
+
+    def delete_tasks(self, task):
+        """Delete a leased LocalTask, or a list of them, from the queue."""
+
+        if not isinstance(task, list):
+            task = [task]
+        names = set(t.name for t in task)
+        with self._lock:
+            self._tasks = [t for t in self._tasks if t.name not in names]
+
+    def fetch_statistics(self):
+        """Return the LocalQueueStatistics of the queue."""
+
+        now = time.time()
+        with self._lock:
+            in_flight = len([t for t in self._tasks if t.eta > now])
+            return LocalQueueStatistics(len(self._tasks), in_flight)
+
+    def __len__(self):
+        return len(self._tasks)
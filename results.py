@@ -0,0 +1,206 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records the completion of asynchronous solves, and lets requests wait on it.
+
+The solver writes a completion flag to memcache, which waiting requests poll
+cheaply, and to the datastore, which is checked occasionally in case the
+memcache entry was evicted.
+
+Solves are also indexed by a hash of the submitted image, so that resubmitting
+the same image returns the earlier result instead of solving it again.
+
+Completion records are deleted by delete_expired() once they are older than
+config.RESULT_RETENTION_SECONDS.
+"""
+
+import datetime
+import hashlib
+import os
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import config
+
+
+STATUS_DONE = 'DONE'
+STATUS_ERROR = 'ERROR'
+STATUS_PENDING = 'PENDING'
+
+MEMCACHE_PREFIX = 'result:'
+IMAGE_INDEX_PREFIX = 'image:'
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+DATASTORE_CHECK_INTERVAL = 2.0
+CLEANUP_BATCH_SIZE = 500
+
+
+class SolveResult(ndb.Model):
+    """Completion record of an asynchronous solve, keyed by its result id."""
+
+    # memcache is managed explicitly by this module.
+    _use_cache = False
+    _use_memcache = False
+
+    status = ndb.StringProperty(indexed=False)
+    solved_url = ndb.StringProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+def result_id(filename):
+    """Return the result id for a GCS-formatted result filename."""
+
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def mark_done(filename, solved_url, status=STATUS_DONE):
+    """Signal that the result for the given filename has been written.
+
+    Args:
+        filename: The GCS-formatted filename the result was written to.
+        solved_url: The URL at which the result can be read.
+        status: STATUS_DONE, or STATUS_ERROR if an error image was written.
+    """
+
+    mark_done_multi([(filename, solved_url, status)])
+
+
+def mark_done_multi(done):
+    """Signal that several results have been written, in one batch.
+
+    Args:
+        done: A list of (filename, solved_url, status) tuples, as would be
+            passed to mark_done().
+    """
+
+    flags = {}
+    entities = []
+    for filename, solved_url, status in done:
+        rid = result_id(filename)
+        flags[MEMCACHE_PREFIX + rid] = {'status': status,
+                                        'solved_url': solved_url}
+        entities.append(
+                SolveResult(id=rid, status=status, solved_url=solved_url))
+    memcache.set_multi(flags, time=config.RESULT_TTL_SECONDS)
+    ndb.put_multi(entities)
+
+
+def wait_for_result(rid, timeout):
+    """Wait for the result with the given id to be written.
+
+    Args:
+        rid: The result id, as returned by result_id().
+        timeout: Maximum number of seconds to wait.
+
+    Returns:
+        A dict with the 'status' and 'solved_url' of the result, or None if
+        the result was not written before the timeout.
+    """
+
+    deadline = time.time() + timeout
+    next_datastore_check = time.time()
+    interval = POLL_INTERVAL
+    while True:
+        result = memcache.get(MEMCACHE_PREFIX + rid)
+        if result:
+            return result
+        now = time.time()
+        if now >= next_datastore_check:
+            result = _stored_result(rid)
+            if result:
+                return result
+            next_datastore_check = now + DATASTORE_CHECK_INTERVAL
+        if now + interval > deadline:
+            return None
+        time.sleep(interval)
+        interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+
+
+def _stored_result(rid):
+    """Return the result with the given id from the datastore, in the form
+    stored in memcache, or None if it has not been written."""
+
+    entity = SolveResult.get_by_id(rid)
+    if not entity:
+        return None
+    return {'status': entity.status, 'solved_url': entity.solved_url}
+
+
+def delete_expired(deadline, batch_size=CLEANUP_BATCH_SIZE):
+    """Delete the completion records older than
+    config.RESULT_RETENTION_SECONDS.
+
+    Args:
+        deadline: The time, in seconds since the epoch, after which no more
+            records are deleted.
+        batch_size: Number of records deleted at once.
+
+    Returns:
+        The number of records deleted.
+    """
+
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=config.RESULT_RETENTION_SECONDS)
+    query = SolveResult.query(SolveResult.created < cutoff)
+    deleted = 0
+    cursor = None
+    more = True
+    while more and time.time() < deadline:
+        # Page with a cursor, as the query may still return records that
+        # were just deleted.
+        keys, cursor, more = query.fetch_page(batch_size, keys_only=True,
+                                              start_cursor=cursor)
+        ndb.delete_multi(keys)
+        deleted += len(keys)
+    return deleted
+
+
+def image_digest(image_data):
+    """Return the hex digest used to index the given image data."""
+
+    return hashlib.sha1(image_data).hexdigest()
+
+
+def find_image(digest):
+    """Look up an earlier solve of the image with the given digest.
+
+    Solves that are known to have failed, from memcache or else from the
+    datastore, are not returned, so the image is tried again.
+
+    Args:
+        digest: The image digest, as returned by image_digest().
+
+    Returns:
+        The response dict returned to the client for the earlier solve, or None.
+    """
+
+    resp = memcache.get(IMAGE_INDEX_PREFIX + digest)
+    if not resp:
+        return None
+    result = memcache.get(MEMCACHE_PREFIX + resp['result_id'])
+    if not result:
+        result = _stored_result(resp['result_id'])
+    if result and result['status'] == STATUS_ERROR:
+        return None
+    return resp
+
+
+def remember_image(digest, resp):
+    """Index the response for a staged solve by its image digest.  The entry
+    expires after config.IMAGE_INDEX_TTL_SECONDS."""
+
+    memcache.set(IMAGE_INDEX_PREFIX + digest, resp,
+                 time=config.IMAGE_INDEX_TTL_SECONDS)
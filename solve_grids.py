@@ -0,0 +1,235 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves a stream of newline-delimited sudoku grids.
+
+Grids are read lazily from files or stdin, and one line is written for each
+grid as soon as it is solved: the solution, or "error: " and the reason it
+could not be solved. Only running statistics are kept, so dumps of any size
+are solved in constant memory. The search strategy can be chosen, and the
+search counters are reported, to tune the solver against a corpus.
+
+Usage: python solve_grids.py [-p PROCESSES] [-o OUTPUT] [--select STRATEGY]
+                             [--order ORDER] [--restarts N] [FILE ...]
+"""
+
+import argparse
+import collections
+import itertools
+import multiprocessing
+import sys
+import time
+
+import sudoku_core
+from sudoku_core import strategies
+
+
+# Number of grids sent to a worker process at once.
+CHUNK_SIZE = 256
+# Number of chunks in flight per worker process.
+CHUNKS_PER_PROCESS = 2
+
+# The Searcher of this process.
+_searcher = sudoku_core.Searcher()
+
+
+def init_searcher(select='mrv', order='ascending', restarts=0):
+    """Configure the Searcher of this process.
+
+    Args:
+        select: Name of the cell selection strategy, from
+            strategies.SELECT_STRATEGIES.
+        order: Name of the value ordering, from strategies.VALUE_ORDERS.
+        restarts: Number of random restarts allowed per grid.
+    """
+
+    global _searcher
+    _searcher = sudoku_core.Searcher(
+            strategies.SELECT_STRATEGIES[select](),
+            strategies.VALUE_ORDERS[order], restarts)
+
+
+def solve_line(line):
+    """Solve the grid on one line.
+
+    Args:
+        line: A grid string, with blanks as '0' or '.'.
+
+    Returns:
+        A tuple of the solution string (or None), the error message (or None),
+        the time taken in seconds and the SearchStats of the solve.
+    """
+
+    stats = sudoku_core.SearchStats()
+    start = time.time()
+    try:
+        solution = _searcher.solve(line, stats)
+    except (sudoku_core.ContradictionError, ValueError) as e:
+        return None, str(e), time.time() - start, stats
+    return solution, None, time.time() - start, stats
+
+
+def solve_chunk(lines):
+    """Solve a list of grid lines; see solve_line()."""
+
+    return [solve_line(line) for line in lines]
+
+
+def read_grids(files):
+    """Generate the non-blank lines of each file, stripped, one at a time."""
+
+    for f in files:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _chunks(iterable, size):
+    """Generate lists of up to size consecutive items of iterable."""
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_stream(grids, processes=0, chunk_size=CHUNK_SIZE,
+                 searcher_args=()):
+    """Solve grids in order, with a bounded number of grids in flight.
+
+    Args:
+        grids: An iterable of grid strings.
+        processes: Number of worker processes, or 0 to solve in this process.
+        chunk_size: Number of grids sent to a worker process at once.
+        searcher_args: Arguments of init_searcher() for each process.
+
+    Yields:
+        A tuple of the grid and the result of solve_line() for each grid.
+    """
+
+    if not processes:
+        init_searcher(*searcher_args)
+        for grid in grids:
+            yield grid, solve_line(grid)
+        return
+
+    pool = multiprocessing.Pool(processes, init_searcher, searcher_args)
+    try:
+        # Pool.imap() would read all the grids ahead of the workers, so chunks
+        # are submitted only as earlier ones are collected.
+        pending = collections.deque()
+        for chunk in _chunks(grids, chunk_size):
+            pending.append((chunk, pool.apply_async(solve_chunk, (chunk,))))
+            if len(pending) >= processes * CHUNKS_PER_PROCESS:
+                chunk, result = pending.popleft()
+                for item in zip(chunk, result.get()):
+                    yield item
+        while pending:
+            chunk, result = pending.popleft()
+            for item in zip(chunk, result.get()):
+                yield item
+    finally:
+        pool.terminate()
+
+
+class RunningStats(object):
+    """Statistics of the grids solved so far, kept in constant memory.
+
+    Attributes:
+        count: Number of grids.
+        solved: Number of grids solved.
+        total_seconds: Total time spent solving.
+        max_seconds: Longest time spent on one grid.
+        search: The SearchStats of all the grids.
+    """
+
+    def __init__(self):
+        """Initialize the RunningStats object and attributes."""
+
+        self.count = 0
+        self.solved = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.search = sudoku_core.SearchStats()
+
+    def add(self, solution, seconds, search):
+        """Add the result of one grid."""
+
+        self.count += 1
+        if solution:
+            self.solved += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.search.add(search)
+
+    def __str__(self):
+        if not self.count:
+            return 'No puzzles.'
+        return ('Solved %d of %d puzzles (avg %.4f secs (%d Hz), '
+                'max %.4f secs). Search: %s.' % (
+                        self.solved, self.count,
+                        self.total_seconds / self.count,
+                        self.count / (self.total_seconds or 1e-9),
+                        self.max_seconds, self.search))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description='Solve newline-delimited sudoku grids.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='files of grids, one per line; stdin if none')
+    parser.add_argument('-p', '--processes', type=int, default=0,
+                        help='number of worker processes; 0 solves in this '
+                        'process, -1 uses one per core')
+    parser.add_argument('-o', '--output', default='-',
+                        help='file to write solutions to; stdout by default')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='number of grids sent to a worker at once')
+    parser.add_argument('--select', default='mrv',
+                        choices=sorted(strategies.SELECT_STRATEGIES),
+                        help='cell selection strategy of the search')
+    parser.add_argument('--order', default='ascending',
+                        choices=sorted(strategies.VALUE_ORDERS),
+                        help='value ordering of the search')
+    parser.add_argument('--restarts', type=int, default=0,
+                        help='number of random restarts allowed per grid')
+    args = parser.parse_args(argv)
+
+    processes = args.processes
+    if processes < 0:
+        processes = multiprocessing.cpu_count()
+    files = [open(name) for name in args.files] or [sys.stdin]
+    if args.output == '-':
+        output = sys.stdout
+    else:
+        output = open(args.output, 'w')
+
+    stats = RunningStats()
+    start = time.time()
+    for grid, (solution, error, seconds, search) in solve_stream(
+            read_grids(files), processes, args.chunk_size,
+            (args.select, args.order, args.restarts)):
+        stats.add(solution, seconds, search)
+        output.write((solution or 'error: %s' % error) + '\n')
+    output.flush()
+    sys.stderr.write('%s Wall time %.2f secs.\n' % (
+            stats, time.time() - start))
+    return 0 if stats.solved == stats.count else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
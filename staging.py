@@ -0,0 +1,183 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stages sudoku puzzle images to be solved asynchronously by the solver module."""
+
+import logging
+import math
+import urllib
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+import admission
+import config
+import pull_queue
+import results
+import utils
+
+
+API_URL = 'https://storage.googleapis.com'
+TIMINGS_KEY = 'stage_timings'
+
+
+def load_timings():
+    """Return the average time of each stage of a solve, as published by the
+    solver module."""
+
+    return memcache.get(TIMINGS_KEY) or {}
+
+
+def publish_timings(timings):
+    """Publish the admission.StageTimings measured by a solver instance."""
+
+    memcache.set(TIMINGS_KEY, timings.averages())
+
+
+def _solve_queue(request_class):
+    """Return the queue solve tasks of the given request class are added to."""
+
+    if config.SOLVE_QUEUE_MODE == 'pull' and request_class == config.BULK:
+        return taskqueue.Queue(config.PULL_QUEUE_NAME)
+    return taskqueue.Queue(config.SOLVE_QUEUES[request_class])
+
+
+# Backpressure controllers of each request class's queue, shared by all request
+# threads of this instance.  Bulk solves are never sent to the synchronous
+# path.
+BACKPRESSURE = {
+    config.INTERACTIVE: admission.BackpressureController(
+            _solve_queue(config.INTERACTIVE),
+            config.MAX_QUEUE_WAIT_SECONDS[config.INTERACTIVE],
+            config.SOLVE_QUEUE_CONCURRENCY[config.INTERACTIVE],
+            config.SYNC_MAX_IMAGE_BYTES,
+            load_timings),
+    config.BULK: admission.BackpressureController(
+            _solve_queue(config.BULK),
+            config.MAX_QUEUE_WAIT_SECONDS[config.BULK],
+            config.SOLVE_QUEUE_CONCURRENCY[config.BULK],
+            0,
+            load_timings),
+}
+
+
+def error_response(filename, solved_url):
+    """Copy an error message image to the GCS file indicated to contain the
+    result, and return the response to send to the client."""
+
+    utils.copy_error_image(filename)
+    # respond to the client, indicating the URL to which the result has
+    # been written.
+    return {'status': 'ERROR', 'solved_url': solved_url,
+            'result_id': results.result_id(filename)}
+
+
+def stage_solve(image_data=None, image_url=None, request_class=config.BULK,
+                backpressure=None):
+    """Launches a task queue task, run on a VM backend, to solve the given puzzle.
+
+    Args:
+        image_data: The (decoded) image data to solve. If the same image was
+            staged recently, the earlier response is returned. Otherwise the
+            image is sent as the task payload when small enough, or written to
+            a GCS file for the task to fetch.
+        image_url: URL of an image to solve, used if image_data is not given.
+        request_class: config.INTERACTIVE or config.BULK, choosing the queue.
+        backpressure: admission.BackpressureController deciding whether the
+            solve is queued. If given and the queue is backed up, the returned
+            status is 'SYNC', with the URL of the synchronous solver to post the
+            image to, or 'BUSY', with the number of seconds after which to
+            retry.
+
+    Returns:
+        A dict to return to the client as JSON, which includes a URL that will
+        contain the result and the id of the result.
+    """
+
+    digest = None
+    if image_data:
+        # If the same image was submitted recently, return its result rather
+        # than solving it again.
+        digest = results.image_digest(image_data)
+        resp = results.find_image(digest)
+        if resp:
+            logging.info("found earlier result %s", resp['result_id'])
+            return resp
+    if backpressure:
+        decision, wait = backpressure.admit(len(image_data or ''))
+        if decision == admission.SYNC:
+            logging.info("queue backed up (%.1fs), using sync path", wait)
+            return {'status': 'SYNC', 'solve_url': '/solve_sync'}
+        elif decision == admission.REJECT:
+            logging.info("queue backed up (%.1fs), rejecting", wait)
+            return {'status': 'BUSY', 'retry_after': int(math.ceil(wait))}
+    # generate a URL to which the result will be written
+    filename = utils.create_fname('jpg')  # A new GCS-formatted filename.
+    # based on the filename, the results will show up at this URL.
+    solved_url = API_URL + filename
+    if image_data and len(image_data) > config.INLINE_IMAGE_MAX_BYTES:
+        # The image is too large to send inline; write it to a GCS file and
+        # generate a URL
+        gcs_file = utils.create_png_file(image_data)
+        image_url = API_URL + gcs_file
+        image_data = None
+    if not image_data and not image_url:
+        logging.warn("could not generate image url")
+        return error_response(filename, solved_url)
+
+    if config.SOLVE_QUEUE_MODE == 'pull' and request_class == config.BULK:
+        # The task is leased, along with others, by the solver's batch worker.
+        task = taskqueue.Task(method='PULL',
+                              payload=pull_queue.encode_payload(
+                                      filename, image_data, image_url))
+    elif image_data:
+        # Small images travel inside the task itself, so the solver doesn't
+        # need to fetch them back from GCS.
+        logging.info("inlining %d bytes of image data", len(image_data))
+        task_url = '/solve_async?' + urllib.urlencode({'filename': filename})
+        task = taskqueue.Task(url=task_url,
+                              method='POST',
+                              payload=image_data,
+                              headers={'Content-Type': 'application/octet-stream'})
+    else:
+        logging.info("using image url: %s", image_url)
+        # Create a Task Queue task to parse and solve the puzzle.
+        # As task parameters, indicate the URL containing the image to solve, and
+        # the GCS filename to which to write the solution image.
+        task = taskqueue.Task(url='/solve_async',
+                              method='POST',
+                              params={'image_url': image_url,
+                                      'filename': filename})
+    return _add_task(_solve_queue(request_class), task, filename, solved_url,
+                     digest)
+
+
+def _add_task(queue, task, filename, solved_url, digest=None):
+    """Add a solve task to the queue, and return the response to send to the
+    client.  If the digest of the image is given, the response is indexed by it.
+    """
+
+    # The task is handled on a Managed VM.
+    try:
+        queue.add(task)
+    except (taskqueue.UnknownQueueError, taskqueue.TransientError):
+        logging.exception("issue adding task to queue")
+        return error_response(filename, solved_url)
+    # Respond to the client, indicating the URL to which the solution will
+    # be written, and the id with which to wait for it at /result/<id>.
+    resp = {'status': 'OK', 'solved_url': solved_url,
+            'result_id': results.result_id(filename)}
+    if digest:
+        results.remember_image(digest, resp)
+    return resp
@@ -0,0 +1,36 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sudoku solver core shared by the solver apps.
+
+The grid's units and peers are precomputed as tuples of cell indexes, and the
+candidates of each cell are kept as a bitmask.
+
+Only the board, solver and strategies modules are imported with the package.
+The hints, session, sized and variants modules are imported by their users,
+e.g. "from sudoku_core import sized", so that apps which do not use them do
+not pay for them at startup.
+"""
+
+from sudoku_core.board import Board
+from sudoku_core.board import ContradictionError
+from sudoku_core.solver import find_solutions
+from sudoku_core.solver import hidden_singles
+from sudoku_core.solver import naked_singles
+from sudoku_core.solver import search
+from sudoku_core.solver import solve
+from sudoku_core.strategies import BudgetExceeded
+from sudoku_core.strategies import NodeLimit
+from sudoku_core.strategies import Searcher
+from sudoku_core.strategies import SearchStats
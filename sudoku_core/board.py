@@ -0,0 +1,112 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The candidates and placed digits of a puzzle."""
+
+from sudoku_core.tables import ALL, BITS, DIGIT, PEERS
+
+
+class ContradictionError(Exception):
+    """Contradiction found in puzzle."""
+
+
+class Board(object):
+    """The candidates and placed digits of a puzzle.
+
+    Attributes:
+        cands: List of the candidate mask of each cell.
+        values: List of the digit placed in each cell, or 0.
+    """
+
+    __slots__ = ('cands', 'values')
+
+    def __init__(self, grid=None):
+        """Initialize the Board from a grid string.
+
+        Args:
+            grid: String of 81 digits, with blanks as '0' or '.'; other
+                characters are ignored. An empty board if None.
+
+        Raises:
+            ValueError: if the grid does not have 81 cells.
+            ContradictionError: if the givens contradict each other.
+        """
+
+        self.cands = [ALL] * 81
+        self.values = [0] * 81
+        if grid is None:
+            return
+        chars = [c for c in grid if c in '0123456789.']
+        if len(chars) != 81:
+            raise ValueError('Grid does not have 81 cells.')
+        for cell, c in enumerate(chars):
+            if c not in '0.':
+                bit = BITS[int(c) - 1]
+                if not self.cands[cell] & bit:
+                    raise ContradictionError('Puzzle cannot be solved.')
+                self.place(cell, bit)
+
+    def copy(self):
+        """Return a copy of the Board."""
+
+        board = Board()
+        board.cands = self.cands[:]
+        board.values = self.values[:]
+        return board
+
+    def solved(self):
+        """Return True if a digit has been placed in every cell."""
+
+        return 0 not in self.values
+
+    def place(self, cell, bit):
+        """Place the digit of a single-bit mask in a cell, and eliminate it
+        from the cell's peers.
+
+        Raises:
+            ContradictionError: if a peer is left without candidates.
+        """
+
+        cands = self.cands
+        self.values[cell] = DIGIT[bit]
+        cands[cell] = bit
+        for peer in PEERS[cell]:
+            mask = cands[peer]
+            if mask & bit:
+                mask &= ~bit
+                if not mask:
+                    raise ContradictionError('Puzzle cannot be solved.')
+                cands[peer] = mask
+
+    def eliminate(self, cell, mask):
+        """Remove the candidates in mask from a cell.
+
+        Returns:
+            True if any candidate was removed.
+
+        Raises:
+            ContradictionError: if the cell is left without candidates.
+        """
+
+        cands = self.cands[cell]
+        if not cands & mask:
+            return False
+        cands &= ~mask
+        if not cands:
+            raise ContradictionError('Puzzle cannot be solved.')
+        self.cands[cell] = cands
+        return True
+
+    def __str__(self):
+        return ''.join(str(value) for value in self.values)
@@ -0,0 +1,137 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Checks the compiled engine against the pure Python one.
+
+Every grid is propagated and solved by both, with and without a node budget,
+and any difference in the propagated board, the solution, the error raised or
+the search counters is reported. Run it after building sudoku_core._speedups:
+
+    python -m sudoku_core.crosscheck [grids.txt ...]
+
+Without files, it checks random puzzles cut from random solutions, some of them
+with conflicting digits added.
+"""
+
+import random
+import sys
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.solver import hidden_singles, naked_singles
+from sudoku_core.strategies import (BudgetExceeded, Searcher, SearchStats,
+                                     _speedups)
+
+
+RANDOM_GRIDS = 2000
+# Node budget of the budgeted solves, low enough for some puzzles to run out.
+MAX_NODES = 20
+
+
+def _outcome(searcher, grid):
+    """Return the solution or error, and the counters, of a solve."""
+
+    try:
+        result = searcher.solve(grid)
+    except (ValueError, ContradictionError, BudgetExceeded) as e:
+        result = type(e).__name__
+    return result, str(searcher.stats)
+
+
+class _CountingSearcher(object):
+    """A Searcher that keeps the counters of its last solve."""
+
+    def __init__(self, **kwargs):
+        self._searcher = Searcher(**kwargs)
+        self.compiled = self._searcher.compiled
+        self.stats = None
+
+    def solve(self, grid):
+        self.stats = SearchStats()
+        return self._searcher.solve(grid, self.stats)
+
+
+def _propagated(grid):
+    """Return the board after Python propagation, or None."""
+
+    try:
+        board = Board(grid)
+        placed = 0
+        while True:
+            count = naked_singles(board) or hidden_singles(board)
+            if not count:
+                break
+            placed += count
+    except ContradictionError:
+        return None
+    return board.cands, board.values, placed
+
+
+def check_grid(grid):
+    """Return a list of the differences between the engines on a grid."""
+
+    differences = []
+    try:
+        board = Board(grid)
+    except (ValueError, ContradictionError):
+        board = None
+    if board is not None and (_speedups.propagate(board.cands, board.values) !=
+                              _propagated(grid)):
+        differences.append('propagate')
+    for max_nodes in (None, MAX_NODES):
+        python = _outcome(_CountingSearcher(compiled=False,
+                                            max_nodes=max_nodes), grid)
+        compiled = _outcome(_CountingSearcher(max_nodes=max_nodes), grid)
+        if python != compiled:
+            differences.append('search (max_nodes %s): %s != %s'
+                               % (max_nodes, python, compiled))
+    return differences
+
+
+def random_grids(count, seed=0):
+    """Yield random puzzles, some with conflicting digits."""
+
+    rng = random.Random(seed)
+    searcher = Searcher(restarts=1, restart_nodes=1, seed=seed,
+                        compiled=False)
+    for _ in xrange(count):
+        solution = list(searcher.solve('0' * 81))
+        keep = rng.uniform(0.15, 0.5)
+        grid = [digit if rng.random() < keep else '0' for digit in solution]
+        if rng.random() < 0.2:
+            grid[rng.randrange(81)] = str(rng.randint(1, 9))
+        yield ''.join(grid)
+
+
+def main(argv):
+    if _speedups is None:
+        print 'sudoku_core._speedups is not built; run build_speedups.py.'
+        return 1
+    if argv:
+        grids = (line.strip() for path in argv for line in open(path)
+                 if line.strip())
+    else:
+        grids = random_grids(RANDOM_GRIDS)
+    checked = failed = 0
+    for grid in grids:
+        checked += 1
+        differences = check_grid(grid)
+        if differences:
+            failed += 1
+            print '%s: %s' % (grid, '; '.join(differences))
+    print '%d grids checked, %d differ.' % (checked, failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,191 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Snapshots of a puzzle's propagated candidates, for answering hints.
+
+A Snapshot is built once per puzzle, by propagating its givens and solving it.
+It orders every cell a hint can fill, so that each hint for the puzzle, however
+far the player has got, is a lookup in that order.
+"""
+
+import array
+import collections
+import threading
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.solver import hidden_singles, naked_singles, search
+from sudoku_core.tables import DIGIT, POPCOUNT
+
+
+SNAPSHOT_CACHE_SIZE = 1024
+
+# Reasons given with a hint.
+MISTAKE = 'mistake'
+SINGLE = 'single'
+SOLUTION = 'solution'
+
+
+class Hint(object):
+    """A hint for the next cell to fill.
+
+    Attributes:
+        cell: The cell, from 0 to 80 in row-major order.
+        digit: The digit that goes in the cell.
+        reason: SINGLE if the digit follows from propagating the givens,
+            SOLUTION if it is taken from the solution, or MISTAKE if the
+            cell holds a wrong digit.
+    """
+
+    def __init__(self, cell, digit, reason):
+        """Initialize the Hint object and attributes."""
+
+        self.cell = cell
+        self.digit = digit
+        self.reason = reason
+
+
+class Snapshot(object):
+    """The propagated candidate state and solution of a puzzle.
+
+    Attributes:
+        grid: The givens, as a string of 81 digits with blanks as '0'.
+        cands: array.array of the propagated candidate mask of each cell.
+        solution: The solution as a string.
+    """
+
+    def __init__(self, grid, cands, solution):
+        """Initialize the Snapshot object and attributes."""
+
+        self.grid = grid
+        self.cands = cands
+        self.solution = solution
+        # Cells determined by propagation come first, then the others by
+        # their number of candidates.
+        self._order = sorted(
+                (cell for cell in xrange(81) if grid[cell] == '0'),
+                key=lambda cell: POPCOUNT[cands[cell]])
+
+    def next_hint(self, grid=None):
+        """Return the next hint for the puzzle.
+
+        Args:
+            grid: The puzzle as filled in so far, as a string of 81 digits with
+                blanks as '0' or '.'; the givens if None.
+
+        Returns:
+            A Hint, or None if the grid is complete and correct.
+
+        Raises:
+            ValueError: if the grid does not have 81 cells.
+        """
+
+        solution = self.solution
+        if grid is not None:
+            if len(grid) != 81:
+                raise ValueError('Grid does not have 81 cells.')
+            for cell in xrange(81):
+                if grid[cell] not in '0.' and grid[cell] != solution[cell]:
+                    return Hint(cell, int(solution[cell]), MISTAKE)
+        else:
+            grid = self.grid
+        cands = self.cands
+        for cell in self._order:
+            if grid[cell] in '0.':
+                if POPCOUNT[cands[cell]] == 1:
+                    return Hint(cell, DIGIT[cands[cell]], SINGLE)
+                return Hint(cell, int(solution[cell]), SOLUTION)
+        return None
+
+    def encode(self):
+        """Return the snapshot as a compact string, e.g. for memcache."""
+
+        return self.grid + self.solution + self.cands.tostring()
+
+    @classmethod
+    def decode(cls, data):
+        """Return the Snapshot encoded as a string by encode()."""
+
+        cands = array.array('H')
+        cands.fromstring(data[162:])
+        return cls(data[:81], cands, data[81:162])
+
+
+def take_snapshot(grid, searcher=None):
+    """Propagate and solve a puzzle.
+
+    Args:
+        grid: String of 81 digits, with blanks as '0' or '.'.
+        searcher: strategies.Searcher used to solve the puzzle, e.g. to bound
+            the search; solver.search() if None.
+
+    Returns:
+        A Snapshot.
+
+    Raises:
+        ValueError: if the grid does not have 81 cells.
+        ContradictionError: if the puzzle cannot be solved.
+        BudgetExceeded: if the searcher's budget ran out first.
+    """
+
+    board = Board(grid)
+    givens = ''.join(str(value) for value in board.values)
+    while naked_singles(board) or hidden_singles(board):
+        pass
+    cands = array.array('H', board.cands)
+    if searcher is not None:
+        return Snapshot(givens, cands, searcher.solve(givens))
+    solved = search(board.copy())
+    if solved is None:
+        raise ContradictionError('Puzzle cannot be solved.')
+    return Snapshot(givens, cands, str(solved))
+
+
+class SnapshotCache(object):
+    """A bounded cache of the Snapshots of recent puzzles, keyed by their givens.
+    Safe to share between threads."""
+
+    def __init__(self, size=SNAPSHOT_CACHE_SIZE):
+        """Initialize the SnapshotCache to keep up to size snapshots."""
+
+        self.size = size
+        self._snapshots = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, grid, searcher=None):
+        """Return the Snapshot of a puzzle, taking it if it is not cached.
+
+        Args:
+            grid: String of 81 digits, with blanks as '0' or '.'.
+            searcher: Searcher used to solve the puzzle; see take_snapshot().
+
+        Raises:
+            ValueError: if the grid does not have 81 cells.
+            ContradictionError: if the puzzle cannot be solved.
+            BudgetExceeded: if the searcher's budget ran out first.
+        """
+
+        with self._lock:
+            snapshot = self._snapshots.pop(grid, None)
+            if snapshot is not None:
+                self._snapshots[grid] = snapshot
+                return snapshot
+        snapshot = take_snapshot(grid, searcher)
+        with self._lock:
+            self._snapshots[grid] = snapshot
+            while len(self._snapshots) > self.size:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+
+SNAPSHOTS = SnapshotCache()
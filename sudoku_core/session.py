@@ -0,0 +1,260 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental solving of a puzzle while it is being edited.
+
+A SolverSession keeps a trail of the propagated candidate state after each edit.
+Setting a cell propagates only from that cell; clearing one rewinds the trail to
+just before the cell was set and replays the later edits, so undoing the last
+edit costs nothing. Whether the puzzle is solvable, and uniquely so, is derived
+from the previous state's solutions whenever possible.
+"""
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.solver import find_solutions
+from sudoku_core.tables import (BITS, BITS_OF, PEER_UNITS, PEERS, POPCOUNT,
+                                UNITS, UNITS_OF)
+
+
+class SessionStatus(object):
+    """Solvability of the puzzle after an edit.
+
+    Attributes:
+        solvable: True if the puzzle has a solution.
+        unique: True if the puzzle has exactly one solution.
+        solution: A solution as a string, or None if the puzzle is not
+            solvable.
+    """
+
+    def __init__(self, solutions):
+        """Initialize the SessionStatus from up to two solutions."""
+
+        self.solvable = bool(solutions)
+        self.unique = len(solutions) == 1
+        self.solution = solutions[0] if solutions else None
+
+
+class _Edit(object):
+    """An entry of the trail of a SolverSession.
+
+    Attributes:
+        cell: The cell set by the edit.
+        digit: The digit it was set to.
+        board: The propagated Board after the edit, or None if the edits so
+            far contradict each other.
+        solutions: Up to two solutions of the board, or None until needed.
+    """
+
+    __slots__ = ('cell', 'digit', 'board', 'solutions')
+
+    def __init__(self, cell, digit, board, solutions=None):
+        self.cell = cell
+        self.digit = digit
+        self.board = board
+        self.solutions = solutions
+
+
+class SolverSession(object):
+    """A puzzle being edited one cell at a time.
+
+    Cells are numbered 0 to 80 in row-major order.
+    """
+
+    def __init__(self, grid=None):
+        """Initialize the SolverSession, optionally with the givens of a grid.
+
+        Args:
+            grid: String of 81 digits, with blanks as '0' or '.'; other
+                characters are ignored.
+
+        Raises:
+            ValueError: if the grid does not have 81 cells.
+        """
+
+        self._trail = [_Edit(None, 0, Board())]
+        self._digits = [0] * 81
+        if grid is not None:
+            chars = [c for c in grid if c in '0123456789.']
+            if len(chars) != 81:
+                raise ValueError('Grid does not have 81 cells.')
+            for cell, c in enumerate(chars):
+                if c not in '0.':
+                    self._push(cell, int(c))
+
+    @property
+    def grid(self):
+        """The digits set so far, as a string with blanks as '0'."""
+
+        return ''.join(str(digit) for digit in self._digits)
+
+    @property
+    def candidates(self):
+        """The propagated candidate mask of each cell, as a list, or None if
+        the edits contradict each other."""
+
+        board = self._trail[-1].board
+        return board.cands[:] if board else None
+
+    def set_cell(self, cell, digit):
+        """Set a cell to a digit, replacing any digit it was set to.
+
+        Args:
+            cell: The cell, from 0 to 80.
+            digit: The digit, from 1 to 9.
+
+        Returns:
+            The SessionStatus after the edit.
+
+        Raises:
+            ValueError: if the cell or the digit is out of range.
+        """
+
+        if not 0 <= cell < 81:
+            raise ValueError('Cell is not from 0 to 80.')
+        if not 1 <= digit <= 9:
+            raise ValueError('Digit is not from 1 to 9.')
+        if self._digits[cell] == digit:
+            return self.status()
+        if self._digits[cell]:
+            self._remove(cell)
+        self._push(cell, digit)
+        return self.status()
+
+    def clear_cell(self, cell):
+        """Clear a cell.
+
+        Args:
+            cell: The cell, from 0 to 80.
+
+        Returns:
+            The SessionStatus after the edit.
+
+        Raises:
+            ValueError: if the cell is out of range.
+        """
+
+        if not 0 <= cell < 81:
+            raise ValueError('Cell is not from 0 to 80.')
+        if self._digits[cell]:
+            self._remove(cell)
+        return self.status()
+
+    def status(self):
+        """Return the SessionStatus of the puzzle as edited so far."""
+
+        edit = self._trail[-1]
+        if edit.solutions is None:
+            edit.solutions = find_solutions(edit.board) if edit.board else []
+        return SessionStatus(edit.solutions)
+
+    def _push(self, cell, digit):
+        """Apply an edit on top of the trail."""
+
+        previous = self._trail[-1]
+        self._digits[cell] = digit
+        board = None
+        if previous.board:
+            board = previous.board.copy()
+            try:
+                _assign(board, cell, BITS[digit - 1])
+            except ContradictionError:
+                board = None
+        self._trail.append(_Edit(cell, digit, board,
+                                 _derive_solutions(previous, cell, digit)))
+
+    def _remove(self, cell):
+        """Rewind the trail to before a cell was set, and replay later edits."""
+
+        for index in xrange(len(self._trail) - 1, 0, -1):
+            if self._trail[index].cell == cell:
+                break
+        later = self._trail[index + 1:]
+        del self._trail[index:]
+        self._digits[cell] = 0
+        for edit in later:
+            self._push(edit.cell, edit.digit)
+
+
+def _derive_solutions(previous, cell, digit):
+    """Derive the solutions after setting a cell from those before it.
+
+    Returns:
+        Up to two solutions, or None if they must be searched for again.
+    """
+
+    solutions = previous.solutions
+    if solutions is None:
+        return None
+    kept = [solution for solution in solutions
+            if solution[cell] == str(digit)]
+    # Adding a given only removes solutions, so if fewer than two were
+    # known, the kept ones are all there are.
+    if len(solutions) < 2 or len(kept) == 2:
+        return kept
+    return None
+
+
+def _assign(board, cell, bit):
+    """Place a digit and propagate the singles it leads to.
+
+    Only the peers of placed cells are checked for naked singles, and only
+    the units that lost a candidate for hidden singles.
+
+    Raises:
+        ContradictionError: if the placement contradicts the board.
+    """
+
+    cands = board.cands
+    values = board.values
+    pending = [(cell, bit)]
+    while pending:
+        cell, bit = pending.pop()
+        if values[cell]:
+            if cands[cell] != bit:
+                raise ContradictionError('Puzzle cannot be solved.')
+            continue
+        removed = cands[cell] & ~bit
+        if removed == cands[cell]:
+            raise ContradictionError('Puzzle cannot be solved.')
+        board.place(cell, bit)
+        for peer in PEERS[cell]:
+            if not values[peer] and POPCOUNT[cands[peer]] == 1:
+                pending.append((peer, cands[peer]))
+        # The digit left the peers, and the other candidates left the cell.
+        for unit in PEER_UNITS[cell]:
+            _find_hidden_single(board, UNITS[unit], bit, pending)
+        for other_bit in BITS_OF[removed]:
+            for unit in UNITS_OF[cell]:
+                _find_hidden_single(board, UNITS[unit], other_bit, pending)
+
+
+def _find_hidden_single(board, unit, bit, pending):
+    """Add the only cell of a unit where a digit can go to pending, if the
+    digit is not placed in the unit yet.
+
+    Raises:
+        ContradictionError: if the digit cannot go anywhere in the unit.
+    """
+
+    cands = board.cands
+    values = board.values
+    where = None
+    for cell in unit:
+        if cands[cell] & bit:
+            if values[cell] or where is not None:
+                return
+            where = cell
+    if where is None:
+        raise ContradictionError('Puzzle cannot be solved.')
+    pending.append((where, bit))
@@ -0,0 +1,518 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves puzzles of any size from 4x4 to 25x25.
+
+A puzzle of size N = B*B has N*N cells, in N rows, N columns and N boxes of BxB
+cells. Candidates are N-bit masks, and the units and peers of each size are
+generated once, on first use.
+
+Grids are written with one symbol per cell, '1'-'9' then 'A'-'P' for the digits
+1 to 25, and '0' or '.' for blanks; or as whitespace- or comma-separated
+numbers, one per cell, which is unambiguous at any size.
+"""
+
+import random
+import threading
+import time
+
+from sudoku_core.board import ContradictionError
+from sudoku_core.strategies import (RESTART_GROWTH, RESTART_NODES,
+                                     BudgetExceeded, NodeLimit, SearchStats)
+
+
+SYMBOLS = '123456789ABCDEFGHIJKLMNOP'
+BLANKS = '0.'
+MIN_BOX = 2
+MAX_BOX = 5
+# Number of random restarts of a solve before its search is left unlimited.
+RESTARTS = 20
+
+# Number of set bits of each byte.
+_POPCOUNT8 = tuple(bin(mask).count('1') for mask in xrange(1 << 8))
+
+
+def popcount(mask):
+    """Return the number of candidates in a mask of up to 32 bits."""
+
+    return (_POPCOUNT8[mask & 0xff] + _POPCOUNT8[mask >> 8 & 0xff] +
+            _POPCOUNT8[mask >> 16 & 0xff] + _POPCOUNT8[mask >> 24])
+
+
+class Geometry(object):
+    """The cells, units and peers of a puzzle size.
+
+    Attributes:
+        box: Size B of a box's side.
+        size: Number N = B*B of digits, and of cells in a unit.
+        cells: Number of cells, N*N.
+        all: Mask of all N candidates.
+        units: Tuple of the rows, columns and boxes, each a tuple of cells.
+        peers: Tuple of the peers of each cell.
+        segment_groups: Tuple of groups of the B segments, the intersections
+            of a line and a box, that make up a line or a box. Each segment
+            is a tuple of its cells and the cells of the rest of the box (for
+            a line's segments) or line (for a box's segments).
+    """
+
+    def __init__(self, box):
+        """Initialize the Geometry of puzzles with boxes of box x box cells.
+
+        Raises:
+            ValueError: if box is not from MIN_BOX to MAX_BOX.
+        """
+
+        if not MIN_BOX <= box <= MAX_BOX:
+            raise ValueError('Box size is not from %d to %d.' % (
+                    MIN_BOX, MAX_BOX))
+        n = box * box
+        self.box = box
+        self.size = n
+        self.cells = n * n
+        self.all = (1 << n) - 1
+        rows = tuple(tuple(r * n + c for c in xrange(n)) for r in xrange(n))
+        cols = tuple(tuple(r * n + c for r in xrange(n)) for c in xrange(n))
+        boxes = tuple(tuple((br * box + r) * n + bc * box + c
+                            for r in xrange(box) for c in xrange(box))
+                      for br in xrange(box) for bc in xrange(box))
+        self.units = rows + cols + boxes
+        peers = [set() for _ in xrange(self.cells)]
+        for unit in self.units:
+            for cell in unit:
+                peers[cell].update(unit)
+        self.peers = tuple(tuple(sorted(cell_peers - set([cell])))
+                           for cell, cell_peers in enumerate(peers))
+
+        def segment(line, box_cells, rest):
+            cells = tuple(cell for cell in line if cell in box_cells)
+            return cells, tuple(cell for cell in rest if cell not in cells)
+
+        groups = []
+        for lines in (rows, cols):
+            for line in lines:
+                groups.append(tuple(segment(line, set(box_cells), box_cells)
+                                    for box_cells in boxes
+                                    if set(line) & set(box_cells)))
+            for box_cells in boxes:
+                groups.append(tuple(segment(line, set(box_cells), line)
+                                    for line in lines
+                                    if set(line) & set(box_cells)))
+        self.segment_groups = tuple(groups)
+
+
+_geometries = {}
+_geometries_lock = threading.Lock()
+
+
+def geometry(box):
+    """Return the Geometry of puzzles with boxes of box x box cells."""
+
+    with _geometries_lock:
+        if box not in _geometries:
+            _geometries[box] = Geometry(box)
+        return _geometries[box]
+
+
+def _box_for_cells(count):
+    """Return the box size of puzzles of count cells.
+
+    Raises:
+        ValueError: if no supported size has count cells.
+    """
+
+    for box in xrange(MIN_BOX, MAX_BOX + 1):
+        if box ** 4 == count:
+            return box
+    raise ValueError('Grid does not have 16, 81, 256 or 625 cells.')
+
+
+def parse_grid(grid, box=None):
+    """Parse a grid of any supported size.
+
+    Args:
+        grid: The grid string, with a symbol per cell, or a number per cell
+            separated by whitespace or commas.
+        box: The box size, or None to infer it from the number of cells.
+
+    Returns:
+        A tuple of the Geometry and a list of the digit of each cell, or 0.
+
+    Raises:
+        ValueError: if the grid is malformed.
+    """
+
+    tokens = grid.replace(',', ' ').split()
+    numbers = all(token.isdigit() or token == '.' for token in tokens)
+    if numbers and len(tokens) >= 16 and (
+            box is None or len(tokens) == box ** 4):
+        try:
+            shape = geometry(box or _box_for_cells(len(tokens)))
+        except ValueError:
+            shape = None
+        if shape:
+            values = [0 if token == '.' else int(token) for token in tokens]
+            if max(values) > shape.size:
+                raise ValueError('Grid has a digit above %d.' % shape.size)
+            return shape, values
+
+    chars = [c for c in grid.upper() if c in SYMBOLS or c in BLANKS]
+    shape = geometry(box or _box_for_cells(len(chars)))
+    if len(chars) != shape.cells:
+        raise ValueError('Grid does not have %d cells.' % shape.cells)
+    values = [0 if c in BLANKS else SYMBOLS.index(c) + 1 for c in chars]
+    if max(values) > shape.size:
+        raise ValueError('Grid has a digit above %d.' % shape.size)
+    return shape, values
+
+
+def format_grid(values):
+    """Return the grid string of a list of digits, with '0' for blanks."""
+
+    return ''.join(SYMBOLS[value - 1] if value else '0' for value in values)
+
+
+class SizedBoard(object):
+    """The candidates and placed digits of a puzzle of any size.
+
+    Attributes:
+        geometry: The Geometry of the puzzle.
+        cands: List of the candidate mask of each cell.
+        values: List of the digit placed in each cell, or 0.
+        conflicts: List of the number of contradictions each cell was part
+            of, shared by the copies of the board.
+    """
+
+    __slots__ = ('geometry', 'cands', 'values', 'conflicts')
+
+    def __init__(self, geometry, values=None):
+        """Initialize the SizedBoard, placing the given digits.
+
+        Args:
+            geometry: The Geometry of the puzzle.
+            values: List of the digit of each cell, or 0; an empty board if
+                None.
+
+        Raises:
+            ContradictionError: if the givens contradict each other.
+        """
+
+        self.geometry = geometry
+        self.cands = [geometry.all] * geometry.cells
+        self.values = [0] * geometry.cells
+        self.conflicts = [0] * geometry.cells
+        for cell, value in enumerate(values or ()):
+            if value:
+                bit = 1 << (value - 1)
+                if not self.cands[cell] & bit:
+                    raise ContradictionError('Puzzle cannot be solved.')
+                self.place(cell, bit)
+
+    def copy(self):
+        """Return a copy of the SizedBoard."""
+
+        board = SizedBoard.__new__(SizedBoard)
+        board.geometry = self.geometry
+        board.cands = self.cands[:]
+        board.values = self.values[:]
+        board.conflicts = self.conflicts
+        return board
+
+    def solved(self):
+        """Return True if a digit has been placed in every cell."""
+
+        return 0 not in self.values
+
+    def place(self, cell, bit, singles=None):
+        """Place the digit of a single-bit mask in a cell, and eliminate it
+        from the cell's peers.
+
+        Args:
+            singles: Optional list to which peers left with a single candidate
+                are appended.
+
+        Raises:
+            ContradictionError: if a peer is left without candidates.
+        """
+
+        cands = self.cands
+        self.values[cell] = bit.bit_length()
+        cands[cell] = bit
+        for peer in self.geometry.peers[cell]:
+            mask = cands[peer]
+            if mask & bit:
+                mask ^= bit
+                if not mask:
+                    self.conflicts[cell] += 1
+                    self.conflicts[peer] += 1
+                    raise ContradictionError('Puzzle cannot be solved.')
+                cands[peer] = mask
+                if singles is not None and not mask & (mask - 1):
+                    singles.append(peer)
+
+    def __str__(self):
+        return format_grid(self.values)
+
+
+def propagate(board):
+    """Place naked and hidden singles, and eliminate locked candidates, until
+    there are none left.
+
+    Returns:
+        The number of digits placed.
+
+    Raises:
+        ContradictionError: if a contradiction is found.
+    """
+
+    cands = board.cands
+    values = board.values
+    every = board.geometry.all
+    singles = [cell for cell in xrange(board.geometry.cells)
+               if not values[cell] and not cands[cell] & (cands[cell] - 1)]
+    count = 0
+    while True:
+        while singles:
+            cell = singles.pop()
+            if not values[cell]:
+                board.place(cell, cands[cell], singles)
+                count += 1
+        progress = False
+        for unit in board.geometry.units:
+            once = more = placed = 0
+            for cell in unit:
+                mask = cands[cell]
+                if values[cell]:
+                    placed |= mask
+                else:
+                    more |= once & mask
+                    once |= mask
+            if once | placed != every:
+                raise _contradiction(board, unit)
+            hidden = once & ~more & ~placed
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                for cell in unit:
+                    if not values[cell] and cands[cell] & bit:
+                        board.place(cell, bit, singles)
+                        count += 1
+                        progress = True
+                        break
+                else:
+                    raise _contradiction(board, unit)
+        if not progress and not singles:
+            locked_candidates(board, singles)
+            if not singles:
+                return count
+
+
+def locked_candidates(board, singles):
+    """Eliminate each digit confined to one segment of a line or box from the
+    rest of the segment's box or line.
+
+    Args:
+        singles: List to which cells left with a single candidate are
+            appended.
+
+    Returns:
+        The number of cells candidates were eliminated from.
+
+    Raises:
+        ContradictionError: if a cell is left without candidates.
+    """
+
+    cands = board.cands
+    values = board.values
+    count = 0
+    for group in board.geometry.segment_groups:
+        masks = []
+        once = more = 0
+        for cells, _ in group:
+            mask = 0
+            for cell in cells:
+                if not values[cell]:
+                    mask |= cands[cell]
+            masks.append(mask)
+            more |= once & mask
+            once |= mask
+        confined = once & ~more
+        if not confined:
+            continue
+        for (_, rest), mask in zip(group, masks):
+            bits = mask & confined
+            if not bits:
+                continue
+            for cell in rest:
+                if not values[cell] and cands[cell] & bits:
+                    left = cands[cell] & ~bits
+                    if not left:
+                        raise _contradiction(board, (cell,))
+                    cands[cell] = left
+                    count += 1
+                    if not left & (left - 1):
+                        singles.append(cell)
+    return count
+
+
+def _contradiction(board, cells):
+    """Count a contradiction against the open cells of a sequence of cells,
+    and return the ContradictionError to raise."""
+
+    conflicts = board.conflicts
+    values = board.values
+    for cell in cells:
+        if not values[cell]:
+            conflicts[cell] += 1
+    return ContradictionError('Puzzle cannot be solved.')
+
+
+def search(board, stats, max_nodes=None, deadline=None, attempt_nodes=None,
+           rng=None):
+    """Solve a SizedBoard by depth-first search with propagation, branching on
+    a cell with the fewest candidates, and of those the one that was part of
+    the most contradictions.
+
+    Args:
+        board: The SizedBoard to solve; it is modified.
+        stats: SearchStats to count the work done in.
+        max_nodes: Most search nodes to visit, or None.
+        deadline: Time after which the search gives up, or None.
+        attempt_nodes: Optional one-item list of the number of nodes left in
+            the attempt, or of None if it is unlimited.
+        rng: random.Random to break ties between cells and order the digits
+            with, or None to take the first cell and the digits in order.
+
+    Returns:
+        The solved SizedBoard, or None if it cannot be solved.
+
+    Raises:
+        NodeLimit: if the attempt runs out of nodes.
+        BudgetExceeded: if the search runs out of nodes or time.
+    """
+
+    stats.nodes += 1
+    if ((max_nodes is not None and stats.nodes > max_nodes) or
+            (deadline is not None and time.time() > deadline)):
+        raise BudgetExceeded('Search budget exceeded.', stats)
+    if attempt_nodes is not None and attempt_nodes[0] is not None:
+        if attempt_nodes[0] <= 0:
+            raise NodeLimit()
+        attempt_nodes[0] -= 1
+    try:
+        stats.propagations += propagate(board)
+    except ContradictionError:
+        return None
+    cands = board.cands
+    values = board.values
+    conflicts = board.conflicts
+    ties = []
+    fewest = board.geometry.size + 1
+    most = -1
+    for cell in xrange(board.geometry.cells):
+        if not values[cell]:
+            count = popcount(cands[cell])
+            if count < fewest or (count == fewest and conflicts[cell] > most):
+                ties = [cell]
+                fewest = count
+                most = conflicts[cell]
+            elif count == fewest and conflicts[cell] == most:
+                ties.append(cell)
+    if not ties:
+        return board
+    best = rng.choice(ties) if rng else ties[0]
+    mask = cands[best]
+    bits = []
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        bits.append(bit)
+    if rng:
+        rng.shuffle(bits)
+    for bit in bits:
+        child = board.copy()
+        try:
+            child.place(best, bit)
+        except ContradictionError:
+            stats.backtracks += 1
+            continue
+        solved = search(child, stats, max_nodes, deadline, attempt_nodes, rng)
+        if solved:
+            return solved
+        stats.backtracks += 1
+    return None
+
+
+def solve(grid, box=None, stats=None, max_nodes=None, max_seconds=None,
+          restarts=RESTARTS, restart_nodes=RESTART_NODES,
+          restart_growth=RESTART_GROWTH, seed=None):
+    """Solve a puzzle of any supported size.
+
+    The first attempt searches the cells and digits in order. When an attempt
+    runs out of nodes, the search restarts with random tie-breaking and digit
+    order and a larger node limit, keeping the contradiction counts of the
+    cells, since a bad early guess can otherwise keep the search of a large
+    puzzle busy for minutes.
+
+    Args:
+        grid: The grid string; see parse_grid().
+        box: The box size, or None to infer it from the number of cells.
+        stats: Optional SearchStats to add the counters of the solve to.
+        max_nodes: Most search nodes to visit, or None.
+        max_seconds: Most seconds to spend searching, or None.
+        restarts: Number of restarts allowed before the search is run without
+            a node limit; 0 disables restarts.
+        restart_nodes: Node limit of the first attempt.
+        restart_growth: Factor by which the node limit grows on each restart.
+        seed: Seed of the random numbers used after a restart.
+
+    Returns:
+        The solution as a string of one symbol per cell.
+
+    Raises:
+        ValueError: if the grid is malformed.
+        ContradictionError: if the puzzle cannot be solved.
+        BudgetExceeded: if the search runs out of nodes or time.
+    """
+
+    shape, values = parse_grid(grid, box)
+    deadline = None
+    if max_seconds is not None:
+        deadline = time.time() + max_seconds
+    solve_stats = SearchStats()
+    solve_stats.solves = 1
+    try:
+        board = SizedBoard(shape, values)
+        limit = restart_nodes if restarts else None
+        rng = None
+        attempt = 0
+        while True:
+            try:
+                solved = search(board.copy(), solve_stats, max_nodes,
+                                deadline, [limit], rng)
+                break
+            except NodeLimit:
+                attempt += 1
+                solve_stats.restarts += 1
+                if rng is None:
+                    rng = random.Random(seed)
+                if attempt >= restarts:
+                    limit = None
+                else:
+                    limit = int(limit * restart_growth)
+    finally:
+        if stats is not None:
+            stats.add(solve_stats)
+    if solved is None:
+        raise ContradictionError('Puzzle cannot be solved.')
+    return str(solved)
@@ -0,0 +1,171 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves puzzles by constraint propagation and depth-first search."""
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.tables import ALL, BITS_OF, POPCOUNT, UNITS
+
+
+def naked_singles(board):
+    """Place the digit of each cell with a single candidate.
+
+    Returns:
+        The number of digits placed.
+    """
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for cell in xrange(81):
+        if not values[cell] and POPCOUNT[cands[cell]] == 1:
+            board.place(cell, cands[cell])
+            count += 1
+    return count
+
+
+def hidden_singles(board, units=UNITS):
+    """Place each digit that has a single possible cell in a unit.
+
+    Args:
+        board: The Board to propagate.
+        units: The units, each a tuple of 9 cells that holds every digit.
+
+    Returns:
+        The number of digits placed.
+    """
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for unit in units:
+        once = more = placed = 0
+        for cell in unit:
+            mask = cands[cell]
+            if values[cell]:
+                placed |= mask
+            else:
+                more |= once & mask
+                once |= mask
+        if once | placed != ALL:
+            raise ContradictionError('Puzzle cannot be solved.')
+        for bit in BITS_OF[once & ~more & ~placed]:
+            for cell in unit:
+                if not values[cell] and cands[cell] & bit:
+                    board.place(cell, bit)
+                    count += 1
+                    break
+            else:
+                raise ContradictionError('Puzzle cannot be solved.')
+    return count
+
+
+def search(board, guesses=None):
+    """Solve a Board by depth-first search, placing singles at each step.
+
+    Args:
+        board: The Board to solve; it is modified.
+        guesses: Optional one-item list, incremented by the number of guesses
+            made.
+
+    Returns:
+        The solved Board, or None if the board cannot be solved.
+    """
+
+    try:
+        while naked_singles(board) or hidden_singles(board):
+            pass
+    except ContradictionError:
+        return None
+    if board.solved():
+        return board
+    cands = board.cands
+    values = board.values
+    _, cell = min((POPCOUNT[cands[cell]], cell) for cell in xrange(81)
+                  if not values[cell])
+    for bit in BITS_OF[cands[cell]]:
+        if guesses is not None:
+            guesses[0] += 1
+        child = board.copy()
+        try:
+            child.place(cell, bit)
+        except ContradictionError:
+            continue
+        solved = search(child, guesses)
+        if solved:
+            return solved
+    return None
+
+
+def find_solutions(board, limit=2):
+    """Find solutions of a Board, up to limit of them.
+
+    Args:
+        board: The Board to solve; it is not modified.
+        limit: The number of solutions after which to stop searching; 2 tells
+            whether a puzzle's solution is unique.
+
+    Returns:
+        A list of the solutions found, as strings.
+    """
+
+    solutions = []
+    _collect_solutions(board.copy(), limit, solutions)
+    return solutions
+
+
+def _collect_solutions(board, limit, solutions):
+    """Add the solutions of a Board to solutions until it has limit items."""
+
+    try:
+        while naked_singles(board) or hidden_singles(board):
+            pass
+    except ContradictionError:
+        return
+    if board.solved():
+        solutions.append(str(board))
+        return
+    cands = board.cands
+    values = board.values
+    _, cell = min((POPCOUNT[cands[cell]], cell) for cell in xrange(81)
+                  if not values[cell])
+    for bit in BITS_OF[cands[cell]]:
+        child = board.copy()
+        try:
+            child.place(cell, bit)
+        except ContradictionError:
+            continue
+        _collect_solutions(child, limit, solutions)
+        if len(solutions) >= limit:
+            return
+
+
+def solve(grid):
+    """Solve a puzzle.
+
+    Args:
+        grid: String of 81 digits, with blanks as '0' or '.'.
+
+    Returns:
+        The solution as a string of 81 digits.
+
+    Raises:
+        ValueError: if the grid does not have 81 cells.
+        ContradictionError: if the puzzle cannot be solved.
+    """
+
+    board = search(Board(grid))
+    if board is None:
+        raise ContradictionError('Puzzle cannot be solved.')
+    return str(board)
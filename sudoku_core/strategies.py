@@ -0,0 +1,408 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Configurable search: cell selection and value ordering strategies, random
+restarts, and counters of the work done by each solve.
+
+A cell selection strategy has a board_class attribute, the Board class it
+needs, and a select_cell(board, rng) method returning the open cell to branch
+on. A value ordering is a function order(board, cell, rng) returning the
+single-bit masks to try in the cell, in order. rng is a random.Random when
+ties should be broken at random, and None otherwise.
+
+The default strategies run in compiled code when sudoku_core._speedups has been
+built (see build_speedups.py), with the same results, and in Python otherwise.
+"""
+
+import time
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.solver import hidden_singles, naked_singles
+from sudoku_core.tables import BITS_OF, DIGIT, PEERS, POPCOUNT
+
+try:
+    from sudoku_core import _speedups
+except ImportError:
+    _speedups = None
+
+
+# Nodes searched before the first restart, when restarts are enabled.
+RESTART_NODES = 200
+# Factor by which the node limit grows after each restart.
+RESTART_GROWTH = 2
+
+
+class SearchStats(object):
+    """Counters of the work done by one or more solves.
+
+    Attributes:
+        solves: Number of puzzles solved or found unsolvable.
+        nodes: Number of search nodes visited.
+        backtracks: Number of guesses that led to a contradiction.
+        propagations: Number of digits placed by propagation.
+        restarts: Number of random restarts.
+    """
+
+    FIELDS = ('solves', 'nodes', 'backtracks', 'propagations', 'restarts')
+
+    def __init__(self):
+        """Initialize the SearchStats with all counters at zero."""
+
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, other):
+        """Add the counters of another SearchStats to these."""
+
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    @classmethod
+    def from_dict(cls, counters):
+        """Return the SearchStats with the counters of a dict from as_dict()."""
+
+        stats = cls()
+        for field in cls.FIELDS:
+            setattr(stats, field, counters.get(field, 0))
+        return stats
+
+    def as_dict(self):
+        """Return the counters as a dict keyed by name."""
+
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+    def __str__(self):
+        return ', '.join('%s %d' % (field, getattr(self, field))
+                         for field in self.FIELDS)
+
+
+class BucketBoard(Board):
+    """A Board that also keeps its open cells in buckets by their number of
+    candidates, updated as candidates are removed.
+
+    Attributes:
+        buckets: List of the set of open cells with each number of candidates.
+    """
+
+    __slots__ = ('buckets',)
+
+    def __init__(self, grid=None):
+        """Initialize the BucketBoard from a grid string; see Board."""
+
+        self.buckets = [set() for _ in xrange(10)]
+        self.buckets[9].update(xrange(81))
+        super(BucketBoard, self).__init__(grid)
+
+    def copy(self):
+        """Return a copy of the BucketBoard."""
+
+        board = BucketBoard.__new__(BucketBoard)
+        board.cands = self.cands[:]
+        board.values = self.values[:]
+        board.buckets = [set(bucket) for bucket in self.buckets]
+        return board
+
+    def place(self, cell, bit):
+        """Place a digit in a cell; see Board.place()."""
+
+        cands = self.cands
+        buckets = self.buckets
+        values = self.values
+        if not values[cell]:
+            buckets[POPCOUNT[cands[cell]]].discard(cell)
+        values[cell] = DIGIT[bit]
+        cands[cell] = bit
+        for peer in PEERS[cell]:
+            mask = cands[peer]
+            if mask & bit:
+                count = POPCOUNT[mask]
+                mask &= ~bit
+                if not mask:
+                    raise ContradictionError('Puzzle cannot be solved.')
+                cands[peer] = mask
+                if not values[peer]:
+                    buckets[count].discard(peer)
+                    buckets[count - 1].add(peer)
+
+    def eliminate(self, cell, mask):
+        """Remove candidates from a cell; see Board.eliminate()."""
+
+        before = self.cands[cell]
+        if not super(BucketBoard, self).eliminate(cell, mask):
+            return False
+        if not self.values[cell]:
+            self.buckets[POPCOUNT[before]].discard(cell)
+            self.buckets[POPCOUNT[self.cands[cell]]].add(cell)
+        return True
+
+
+class MinRemainingValues(object):
+    """Selects an open cell with the fewest candidates, scanning every cell."""
+
+    board_class = Board
+
+    def select_cell(self, board, rng=None):
+        """Return the cell to branch on; ties are broken at random with rng."""
+
+        cands = board.cands
+        values = board.values
+        best = 10
+        ties = []
+        for cell in xrange(81):
+            if not values[cell]:
+                count = POPCOUNT[cands[cell]]
+                if count < best:
+                    best = count
+                    ties = [cell]
+                elif count == best and rng:
+                    ties.append(cell)
+        return rng.choice(ties) if rng else ties[0]
+
+
+class BucketMinRemainingValues(object):
+    """Selects an open cell with the fewest candidates from the buckets of a
+    BucketBoard, without scanning the cells."""
+
+    board_class = BucketBoard
+
+    def select_cell(self, board, rng=None):
+        """Return the cell to branch on; ties are broken at random with rng."""
+
+        for bucket in board.buckets:
+            if bucket:
+                return rng.choice(list(bucket)) if rng else min(bucket)
+
+
+def ascending(board, cell, rng=None):
+    """Value ordering: the digits in ascending order, or shuffled with rng."""
+
+    bits = list(BITS_OF[board.cands[cell]])
+    if rng:
+        rng.shuffle(bits)
+    return bits
+
+
+def least_constraining(board, cell, rng=None):
+    """Value ordering: the digits that remove the fewest candidates from the
+    cell's open peers first. Ties are broken at random with rng."""
+
+    cands = board.cands
+    values = board.values
+    bits = list(BITS_OF[cands[cell]])
+    if rng:
+        rng.shuffle(bits)
+    bits.sort(key=lambda bit: sum(1 for peer in PEERS[cell]
+                                  if not values[peer] and cands[peer] & bit))
+    return bits
+
+
+SELECT_STRATEGIES = {
+    'mrv': MinRemainingValues,
+    'bucket': BucketMinRemainingValues,
+}
+
+VALUE_ORDERS = {
+    'ascending': ascending,
+    'lcv': least_constraining,
+}
+
+
+class BudgetExceeded(Exception):
+    """The search budget of a solve ran out before the puzzle was solved.
+
+    Attributes:
+        stats: The SearchStats of the solve so far.
+    """
+
+    def __init__(self, message, stats):
+        super(BudgetExceeded, self).__init__(message)
+        self.stats = stats
+
+
+def _random(seed):
+    """Return a random.Random seeded with seed.
+
+    random is imported here, on the first restart, as importing it takes
+    about as long as importing the rest of the package.
+    """
+
+    import random
+    return random.Random(seed)
+
+
+class NodeLimit(Exception):
+    """Raised when a search attempt visits more nodes than its limit.
+
+    Searcher and the sized solver catch it to restart the search.
+    """
+
+
+class Searcher(object):
+    """Solves puzzles by propagation and depth-first search, with pluggable
+    strategies.
+
+    The search checks its budget at every node, so that no puzzle, e.g. a
+    consistent but nearly empty grid misread by OCR, can tie up a worker.
+
+    Attributes:
+        select: The cell selection strategy.
+        order: The value ordering function.
+        restarts: Number of random restarts allowed before the search is run
+            without a node limit; 0 disables restarts.
+        restart_nodes: Node limit of the first attempt.
+        restart_growth: Factor by which the node limit grows on each restart.
+        max_nodes: Most search nodes visited per solve, or None.
+        max_seconds: Most seconds spent searching per solve, or None.
+        compiled: True if solves run in sudoku_core._speedups.
+    """
+
+    def __init__(self, select=None, order=ascending, restarts=0,
+                 restart_nodes=RESTART_NODES, restart_growth=RESTART_GROWTH,
+                 seed=None, max_nodes=None, max_seconds=None, compiled=True):
+        """Initialize the Searcher object and attributes.
+
+        Args:
+            select: The cell selection strategy; MinRemainingValues() if None.
+            seed: Seed of the random numbers used after a restart.
+            compiled: False to always search in Python. Otherwise the search
+                is compiled if _speedups is built and the strategies are the
+                defaults, without restarts.
+        """
+
+        self.select = select or MinRemainingValues()
+        self.order = order
+        self.restarts = restarts
+        self.restart_nodes = restart_nodes
+        self.restart_growth = restart_growth
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+        self._seed = seed
+        self._rng = None
+        self.compiled = bool(compiled and _speedups is not None and
+                             type(self.select) is MinRemainingValues and
+                             order is ascending and not restarts)
+
+    def solve(self, grid, stats=None):
+        """Solve a puzzle.
+
+        Args:
+            grid: String of 81 digits, with blanks as '0' or '.'.
+            stats: Optional SearchStats to add the counters of the solve to.
+
+        Returns:
+            The solution as a string of 81 digits.
+
+        Raises:
+            ValueError: if the grid does not have 81 cells.
+            ContradictionError: if the puzzle cannot be solved.
+            BudgetExceeded: if the search budget ran out first.
+        """
+
+        solve_stats = SearchStats()
+        solve_stats.solves = 1
+        deadline = None
+        if self.max_seconds is not None:
+            deadline = time.time() + self.max_seconds
+        try:
+            board = self.select.board_class(grid)
+            if self.compiled:
+                return self._solve_compiled(board, solve_stats, deadline)
+            limit = self.restart_nodes if self.restarts else None
+            rng = None
+            attempt = 0
+            while True:
+                try:
+                    solved = self._search(board.copy(), solve_stats, [limit],
+                                          rng, deadline)
+                    break
+                except NodeLimit:
+                    attempt += 1
+                    solve_stats.restarts += 1
+                    if self._rng is None:
+                        self._rng = _random(self._seed)
+                    rng = self._rng
+                    if attempt >= self.restarts:
+                        limit = None
+                    else:
+                        limit *= self.restart_growth
+        finally:
+            if stats is not None:
+                stats.add(solve_stats)
+        if solved is None:
+            raise ContradictionError('Puzzle cannot be solved.')
+        return str(solved)
+
+    def _solve_compiled(self, board, stats, deadline):
+        """Solve a board in sudoku_core._speedups; see solve()."""
+
+        outcome, values, nodes, backtracks, propagations = _speedups.search(
+                board.cands, board.values,
+                -1 if self.max_nodes is None else self.max_nodes,
+                deadline or 0.0)
+        stats.nodes += nodes
+        stats.backtracks += backtracks
+        stats.propagations += propagations
+        if outcome == _speedups.BUDGET:
+            raise BudgetExceeded('Search budget exceeded.', stats)
+        if outcome == _speedups.UNSOLVABLE:
+            raise ContradictionError('Puzzle cannot be solved.')
+        return ''.join(str(value) for value in values)
+
+    def _search(self, board, stats, attempt_nodes, rng, deadline):
+        """Depth-first search from a board.
+
+        Args:
+            attempt_nodes: One-item list of the number of nodes left in the
+                attempt, or of None if it is unlimited.
+            deadline: Time after which the search gives up, or None.
+
+        Returns:
+            The solved board, or None if it cannot be solved.
+
+        Raises:
+            NodeLimit: if the attempt runs out of nodes.
+            BudgetExceeded: if the solve runs out of nodes or time.
+        """
+
+        stats.nodes += 1
+        if ((self.max_nodes is not None and stats.nodes > self.max_nodes) or
+                (deadline is not None and time.time() > deadline)):
+            raise BudgetExceeded('Search budget exceeded.', stats)
+        if attempt_nodes[0] is not None:
+            if attempt_nodes[0] <= 0:
+                raise NodeLimit()
+            attempt_nodes[0] -= 1
+        try:
+            while True:
+                placed = naked_singles(board) or hidden_singles(board)
+                if not placed:
+                    break
+                stats.propagations += placed
+        except ContradictionError:
+            return None
+        if board.solved():
+            return board
+        cell = self.select.select_cell(board, rng)
+        for bit in self.order(board, cell, rng):
+            child = board.copy()
+            try:
+                child.place(cell, bit)
+                solved = self._search(child, stats, attempt_nodes, rng,
+                                      deadline)
+            except ContradictionError:
+                solved = None
+            if solved:
+                return solved
+            stats.backtracks += 1
+        return None
@@ -0,0 +1,63 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Constant tables of the 9x9 grid, built once at import.
+
+Cells are numbered 0 to 80 in row-major order. The candidates of a cell are a
+9-bit mask, bit d-1 standing for digit d. All tables are tuples of ints.
+"""
+
+
+ALL = 0x1ff
+BITS = tuple(1 << d for d in xrange(9))
+# Digit of each single-bit mask.
+DIGIT = dict((bit, d + 1) for d, bit in enumerate(BITS))
+POPCOUNT = tuple(bin(mask).count('1') for mask in xrange(ALL + 1))
+
+
+def _bits_of():
+    """Return the bits of every mask, adding one bit at a time to the masks
+    of the lower bits, which is much faster than testing each bit of each
+    mask."""
+
+    bits_of = [()]
+    for bit in BITS:
+        bits_of += [bits + (bit,) for bits in bits_of]
+    return tuple(bits_of)
+
+
+# The single-bit masks in each mask.
+BITS_OF = _bits_of()
+
+ROWS = tuple(tuple(r * 9 + c for c in xrange(9)) for r in xrange(9))
+COLS = tuple(tuple(r * 9 + c for r in xrange(9)) for c in xrange(9))
+BOXES = tuple(tuple((br * 3 + r) * 9 + bc * 3 + c
+                    for r in xrange(3) for c in xrange(3))
+              for br in xrange(3) for bc in xrange(3))
+UNITS = ROWS + COLS + BOXES
+ROW_OF = tuple(cell // 9 for cell in xrange(81))
+COL_OF = tuple(cell % 9 for cell in xrange(81))
+BOX_OF = tuple(ROW_OF[cell] // 3 * 3 + COL_OF[cell] // 3
+               for cell in xrange(81))
+# The row, column and box of each cell, as indexes into UNITS.
+UNITS_OF = tuple((ROW_OF[cell], 9 + COL_OF[cell], 18 + BOX_OF[cell])
+                 for cell in xrange(81))
+PEERS = tuple(tuple(sorted((set(ROWS[ROW_OF[cell]]) | set(COLS[COL_OF[cell]]) |
+                            set(BOXES[BOX_OF[cell]])) - set([cell])))
+              for cell in xrange(81))
+# The units, as indexes into UNITS, containing any peer of each cell: the units
+# where removing a candidate from the cell's peers can leave a hidden single.
+PEER_UNITS = tuple(tuple(sorted(set(unit for peer in PEERS[cell]
+                                    for unit in UNITS_OF[peer])))
+                   for cell in xrange(81))
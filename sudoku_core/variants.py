@@ -0,0 +1,350 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves 9x9 variants: extra units, jigsaw regions and killer cages.
+
+A Rules object replaces the fixed unit and peer tables of the classic grid with
+its own, built once per variant, so propagation and search run on the same
+bitmask candidates as classic puzzles. For example, X-sudoku is
+Rules(extra_units=DIAGONALS), and a jigsaw puzzle is
+Rules(boxes=parse_regions(layout)).
+
+The digits of a killer cage are distinct and add up to its total. Every set of
+distinct digits is precomputed by its size and sum, so pruning a cage is a scan
+of the few digit sets that can still fill its open cells.
+"""
+
+import time
+
+from sudoku_core.board import Board, ContradictionError
+from sudoku_core.solver import hidden_singles, naked_singles
+from sudoku_core.strategies import BudgetExceeded, SearchStats
+from sudoku_core.tables import ALL, BOXES, COLS, DIGIT, POPCOUNT, ROWS
+
+
+# Sum of the digits of each mask.
+SUM_OF = tuple(sum(DIGIT[1 << d] for d in xrange(9) if mask & (1 << d))
+               for mask in xrange(ALL + 1))
+
+
+def _combinations():
+    """Return the masks of distinct digits keyed by their size and sum."""
+
+    combinations = {}
+    for mask in xrange(1, ALL + 1):
+        key = (POPCOUNT[mask], SUM_OF[mask])
+        combinations.setdefault(key, []).append(mask)
+    return dict((key, tuple(masks)) for key, masks in combinations.items())
+
+
+# Masks of the sets of distinct digits of each size and sum, keyed by
+# (size, sum).
+COMBINATIONS = _combinations()
+
+# The two main diagonals, the extra units of X-sudoku.
+DIAGONALS = (tuple(cell * 10 for cell in xrange(9)),
+             tuple(cell * 8 + 8 for cell in xrange(9)))
+
+
+class Cage(object):
+    """A killer cage: cells whose distinct digits add up to a total.
+
+    Attributes:
+        total: The sum of the cage's digits.
+        cells: Tuple of the cage's cells.
+    """
+
+    def __init__(self, total, cells):
+        """Initialize the Cage object and attributes.
+
+        Raises:
+            ValueError: if no distinct digits in the cells can add up to the
+                total.
+        """
+
+        self.total = total
+        self.cells = tuple(cells)
+        if (len(set(self.cells)) != len(self.cells) or
+                (len(self.cells), total) not in COMBINATIONS):
+            raise ValueError('Cage cannot add up to %d.' % total)
+
+
+def parse_regions(layout):
+    """Read the regions of a jigsaw puzzle.
+
+    Args:
+        layout: String of 81 characters, the label of each cell's region;
+            whitespace is ignored.
+
+    Returns:
+        Tuple of the 9 regions, each a tuple of cells.
+
+    Raises:
+        ValueError: if the layout does not have 81 cells in 9 regions of 9.
+    """
+
+    labels = [c for c in layout if not c.isspace()]
+    if len(labels) != 81:
+        raise ValueError('Layout does not have 81 cells.')
+    regions = {}
+    for cell, label in enumerate(labels):
+        regions.setdefault(label, []).append(cell)
+    return tuple(tuple(regions[label]) for label in sorted(regions))
+
+
+class Rules(object):
+    """The units, peers and cages of a 9x9 variant.
+
+    Attributes:
+        units: Tuple of the units, each a tuple of 9 cells that holds every
+            digit: the rows, columns and boxes, then any extra units.
+        peers: Tuple of the peers of each cell, the cells sharing a unit or a
+            cage with it.
+        cages: Tuple of the Cages.
+    """
+
+    def __init__(self, boxes=None, extra_units=(), cages=()):
+        """Initialize the Rules object and attributes.
+
+        Args:
+            boxes: The 9 regions replacing the 3x3 boxes, e.g. from
+                parse_regions(), or None for the classic boxes.
+            extra_units: Further units of 9 cells, e.g. DIAGONALS.
+            cages: Iterable of Cages; no cell may be in two of them.
+
+        Raises:
+            ValueError: if the regions do not cover the grid, a unit does not
+                have 9 distinct cells, or cages overlap.
+        """
+
+        if boxes is None:
+            boxes = BOXES
+        boxes = tuple(tuple(box) for box in boxes)
+        if (len(boxes) != 9 or
+                sorted(cell for box in boxes for cell in box) != range(81)):
+            raise ValueError('Regions do not cover the grid.')
+        self.units = ROWS + COLS + boxes + tuple(tuple(unit)
+                                                 for unit in extra_units)
+        for unit in self.units:
+            if len(set(unit)) != 9 or not set(unit) <= set(xrange(81)):
+                raise ValueError('Unit does not have 9 distinct cells.')
+        self.cages = tuple(cages)
+        caged = [cell for cage in self.cages for cell in cage.cells]
+        if len(set(caged)) != len(caged):
+            raise ValueError('Cages overlap.')
+
+        peers = [set() for _ in xrange(81)]
+        for group in self.units + tuple(cage.cells for cage in self.cages):
+            for cell in group:
+                peers[cell].update(group)
+        self.peers = tuple(tuple(sorted(peers[cell] - set([cell])))
+                           for cell in xrange(81))
+
+
+CLASSIC = Rules()
+
+
+class VariantBoard(Board):
+    """A Board whose digits are eliminated from the peers of its Rules.
+
+    Attributes:
+        rules: The Rules of the variant.
+    """
+
+    __slots__ = ('rules',)
+
+    def __init__(self, rules, grid=None):
+        """Initialize the VariantBoard from a grid string; see Board."""
+
+        self.rules = rules
+        super(VariantBoard, self).__init__(grid)
+
+    def copy(self):
+        """Return a copy of the VariantBoard."""
+
+        board = VariantBoard.__new__(VariantBoard)
+        board.rules = self.rules
+        board.cands = self.cands[:]
+        board.values = self.values[:]
+        return board
+
+    def place(self, cell, bit):
+        """Place a digit in a cell; see Board.place()."""
+
+        cands = self.cands
+        self.values[cell] = DIGIT[bit]
+        cands[cell] = bit
+        for peer in self.rules.peers[cell]:
+            mask = cands[peer]
+            if mask & bit:
+                mask &= ~bit
+                if not mask:
+                    raise ContradictionError('Puzzle cannot be solved.')
+                cands[peer] = mask
+
+
+def cage_sums(board):
+    """Remove the candidates of open cage cells that no set of distinct
+    digits adding up to what is left of the cage's total can use.
+
+    Returns:
+        The number of cells that lost candidates.
+
+    Raises:
+        ContradictionError: if a cage cannot add up to its total.
+    """
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for cage in board.rules.cages:
+        left = cage.total
+        open_cells = []
+        union = 0
+        for cell in cage.cells:
+            if values[cell]:
+                left -= values[cell]
+            else:
+                open_cells.append(cell)
+                union |= cands[cell]
+        if not open_cells:
+            if left:
+                raise ContradictionError('Puzzle cannot be solved.')
+            continue
+        allowed = 0
+        for combination in COMBINATIONS.get((len(open_cells), left), ()):
+            # Placed digits are already gone from the cage's open cells.
+            if combination & ~union:
+                continue
+            for cell in open_cells:
+                if not cands[cell] & combination:
+                    break
+            else:
+                allowed |= combination
+        if not allowed:
+            raise ContradictionError('Puzzle cannot be solved.')
+        for cell in open_cells:
+            if board.eliminate(cell, ALL & ~allowed):
+                count += 1
+    return count
+
+
+def propagate(board):
+    """Place singles and prune cages until neither makes progress.
+
+    Returns:
+        The number of digits placed.
+
+    Raises:
+        ContradictionError: if the board cannot be solved.
+    """
+
+    placed = 0
+    units = board.rules.units
+    while True:
+        count = naked_singles(board) or hidden_singles(board, units)
+        if count:
+            placed += count
+        elif not cage_sums(board):
+            return placed
+
+
+def search(board, stats, max_nodes=None, deadline=None):
+    """Solve a VariantBoard by depth-first search with propagation, branching
+    on a cell with the fewest candidates.
+
+    Args:
+        board: The VariantBoard to solve; it is modified.
+        stats: SearchStats to count the work done in.
+        max_nodes: Most search nodes to visit, or None.
+        deadline: Time after which the search gives up, or None.
+
+    Returns:
+        The solved VariantBoard, or None if it cannot be solved.
+
+    Raises:
+        BudgetExceeded: if the search runs out of nodes or time.
+    """
+
+    stats.nodes += 1
+    if ((max_nodes is not None and stats.nodes > max_nodes) or
+            (deadline is not None and time.time() > deadline)):
+        raise BudgetExceeded('Search budget exceeded.', stats)
+    try:
+        stats.propagations += propagate(board)
+    except ContradictionError:
+        return None
+    cands = board.cands
+    values = board.values
+    best = None
+    fewest = 10
+    for cell in xrange(81):
+        if not values[cell] and POPCOUNT[cands[cell]] < fewest:
+            best = cell
+            fewest = POPCOUNT[cands[cell]]
+            if fewest == 2:
+                break
+    if best is None:
+        return board
+    mask = cands[best]
+    while mask:
+        bit = mask & -mask
+        mask ^= bit
+        child = board.copy()
+        try:
+            child.place(best, bit)
+        except ContradictionError:
+            stats.backtracks += 1
+            continue
+        solved = search(child, stats, max_nodes, deadline)
+        if solved:
+            return solved
+        stats.backtracks += 1
+    return None
+
+
+def solve(grid, rules, stats=None, max_nodes=None, max_seconds=None):
+    """Solve a variant puzzle.
+
+    Args:
+        grid: String of 81 digits, with blanks as '0' or '.', or None for an
+            empty grid, as in most killer puzzles.
+        rules: The Rules of the variant.
+        stats: Optional SearchStats to add the counters of the solve to.
+        max_nodes: Most search nodes to visit, or None.
+        max_seconds: Most seconds to spend searching, or None.
+
+    Returns:
+        The solution as a string of 81 digits.
+
+    Raises:
+        ValueError: if the grid does not have 81 cells.
+        ContradictionError: if the puzzle cannot be solved.
+        BudgetExceeded: if the search runs out of nodes or time.
+    """
+
+    deadline = None
+    if max_seconds is not None:
+        deadline = time.time() + max_seconds
+    solve_stats = SearchStats()
+    solve_stats.solves = 1
+    try:
+        solved = search(VariantBoard(rules, grid), solve_stats, max_nodes,
+                        deadline)
+    finally:
+        if stats is not None:
+            stats.add(solve_stats)
+    if solved is None:
+        raise ContradictionError('Puzzle cannot be solved.')
+    return str(solved)
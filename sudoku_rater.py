@@ -0,0 +1,289 @@
+# Copyright 2014 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Solves sudoku puzzles with human-style techniques, and rates their difficulty.
+
+The candidates of each cell are kept as a 9-bit mask, bit d-1 standing for
+digit d. The techniques are tried from the simplest up, restarting from the
+simplest after each one that makes progress; search is used only once they
+all stall. A puzzle is rated by the hardest technique it needed.
+
+Usage: python sudoku_rater.py [FILE ...]
+"""
+
+import itertools
+import sys
+
+import solve_grids
+from sudoku_core import Board, ContradictionError, search
+from sudoku_core.solver import hidden_singles, naked_singles
+from sudoku_core.tables import (ALL, BITS, BITS_OF, BOX_OF, BOXES, COL_OF,
+                                COLS, POPCOUNT, ROW_OF, ROWS, UNITS)
+
+
+# Each technique applies every instance of itself it finds to a Board, and
+# returns the number of instances applied.
+
+def naked_subsets(board, size):
+    """Eliminate the candidates of each group of size cells of a unit that
+    have only size candidates between them from the rest of the unit."""
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for unit in UNITS:
+        open_cells = [cell for cell in unit if not values[cell]]
+        if len(open_cells) <= size:
+            continue
+        cells = [cell for cell in open_cells if POPCOUNT[cands[cell]] <= size]
+        for subset in itertools.combinations(cells, size):
+            mask = 0
+            for cell in subset:
+                mask |= cands[cell]
+            if POPCOUNT[mask] != size:
+                continue
+            progress = False
+            for cell in open_cells:
+                if cell not in subset and board.eliminate(cell, mask):
+                    progress = True
+            count += progress
+    return count
+
+
+def hidden_subsets(board, size):
+    """Keep only the size digits in each group of size cells of a unit that
+    are the only cells of the unit where those digits can go."""
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for unit in UNITS:
+        open_cells = [cell for cell in unit if not values[cell]]
+        if len(open_cells) <= size:
+            continue
+        # Mask of the positions in open_cells of each digit.
+        positions = []
+        for bit in BITS:
+            where = 0
+            for i, cell in enumerate(open_cells):
+                if cands[cell] & bit:
+                    where |= 1 << i
+            if 2 <= POPCOUNT[where] <= size:
+                positions.append((bit, where))
+        for subset in itertools.combinations(positions, size):
+            mask = where = 0
+            for bit, digit_where in subset:
+                mask |= bit
+                where |= digit_where
+            if POPCOUNT[where] != size:
+                continue
+            progress = False
+            for i, cell in enumerate(open_cells):
+                if where >> i & 1 and board.eliminate(cell, ALL & ~mask):
+                    progress = True
+            count += progress
+    return count
+
+
+def pointing(board):
+    """Eliminate a digit from the rest of a row or column when all its
+    candidates in a box lie in that row or column."""
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for box in BOXES:
+        for bit in BITS:
+            cells = [cell for cell in box if not values[cell] and
+                     cands[cell] & bit]
+            if len(cells) < 2:
+                continue
+            for line_of, lines in ((ROW_OF, ROWS), (COL_OF, COLS)):
+                line = line_of[cells[0]]
+                if all(line_of[cell] == line for cell in cells[1:]):
+                    progress = False
+                    for cell in lines[line]:
+                        if (cell not in box and not values[cell] and
+                                board.eliminate(cell, bit)):
+                            progress = True
+                    count += progress
+    return count
+
+
+def box_line_reduction(board):
+    """Eliminate a digit from the rest of a box when all its candidates in a
+    row or column lie in that box."""
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for line in ROWS + COLS:
+        for bit in BITS:
+            cells = [cell for cell in line if not values[cell] and
+                     cands[cell] & bit]
+            if len(cells) < 2:
+                continue
+            box = BOX_OF[cells[0]]
+            if all(BOX_OF[cell] == box for cell in cells[1:]):
+                progress = False
+                for cell in BOXES[box]:
+                    if (cell not in line and not values[cell] and
+                            board.eliminate(cell, bit)):
+                        progress = True
+                count += progress
+    return count
+
+
+def fish(board, size):
+    """Eliminate a digit from size columns when its candidates in size rows
+    all lie in those columns, and likewise with rows and columns swapped:
+    X-wing for size 2, swordfish for size 3."""
+
+    count = 0
+    cands = board.cands
+    values = board.values
+    for bases, base_of, covers, cover_of in ((ROWS, ROW_OF, COLS, COL_OF),
+                                             (COLS, COL_OF, ROWS, ROW_OF)):
+        for bit in BITS:
+            lines = []
+            for base in bases:
+                where = 0
+                for cell in base:
+                    if not values[cell] and cands[cell] & bit:
+                        where |= 1 << cover_of[cell]
+                if 2 <= POPCOUNT[where] <= size:
+                    lines.append((base_of[base[0]], where))
+            for subset in itertools.combinations(lines, size):
+                where = 0
+                for _, line_where in subset:
+                    where |= line_where
+                if POPCOUNT[where] != size:
+                    continue
+                base_lines = set(line for line, _ in subset)
+                progress = False
+                for cover in xrange(9):
+                    if not where >> cover & 1:
+                        continue
+                    for cell in covers[cover]:
+                        if (base_of[cell] not in base_lines and
+                                not values[cell] and
+                                board.eliminate(cell, bit)):
+                            progress = True
+                count += progress
+    return count
+
+
+# The name, weight and function of each technique, from the simplest up.
+TECHNIQUES = (
+    ('naked single', 1, naked_singles),
+    ('hidden single', 2, hidden_singles),
+    ('naked pair', 3, lambda board: naked_subsets(board, 2)),
+    ('pointing', 4, pointing),
+    ('box-line reduction', 4, box_line_reduction),
+    ('hidden pair', 5, lambda board: hidden_subsets(board, 2)),
+    ('naked triple', 6, lambda board: naked_subsets(board, 3)),
+    ('hidden triple', 7, lambda board: hidden_subsets(board, 3)),
+    ('x-wing', 8, lambda board: fish(board, 2)),
+    ('swordfish', 10, lambda board: fish(board, 3)),
+)
+SEARCH = 'search'
+SEARCH_WEIGHT = 20
+
+# The grade of puzzles whose hardest technique has up to each weight.
+GRADES = ((2, 'easy'), (5, 'medium'), (10, 'hard'), (SEARCH_WEIGHT, 'fiendish'))
+
+
+class Rating(object):
+    """The solution and difficulty of a puzzle.
+
+    Attributes:
+        solution: The solution as a string.
+        techniques: Dict of the number of times each technique was applied,
+            keyed by name. 'search' counts the guesses made.
+        difficulty: Weight of the hardest technique applied.
+        score: Sum of the weights of all the techniques applied.
+        grade: 'easy', 'medium', 'hard' or 'fiendish'.
+    """
+
+    def __init__(self, solution, techniques):
+        """Initialize the Rating object and attributes."""
+
+        weights = dict((name, weight) for name, weight, _ in TECHNIQUES)
+        weights[SEARCH] = SEARCH_WEIGHT
+        self.solution = solution
+        self.techniques = techniques
+        self.difficulty = max([weights[name] for name in techniques] or [0])
+        self.score = sum(weights[name] * count
+                         for name, count in techniques.iteritems())
+        self.grade = next(grade for weight, grade in GRADES
+                          if self.difficulty <= weight)
+
+
+def rate(grid):
+    """Solve a puzzle with human-style techniques and rate its difficulty.
+
+    Args:
+        grid: String of 81 digits, with blanks as '0' or '.'.
+
+    Returns:
+        A Rating.
+
+    Raises:
+        ValueError: if the grid does not have 81 cells.
+        ContradictionError: if the puzzle cannot be solved.
+    """
+
+    board = Board(grid)
+    techniques = {}
+    while not board.solved():
+        for name, _, technique in TECHNIQUES:
+            count = technique(board)
+            if count:
+                techniques[name] = techniques.get(name, 0) + count
+                break
+        else:
+            guesses = [0]
+            board = search(board, guesses)
+            techniques[SEARCH] = guesses[0]
+            if board is None:
+                raise ContradictionError('Puzzle cannot be solved.')
+    return Rating(str(board), techniques)
+
+
+def main(argv=None):
+    """Rate the grids in the given files, or stdin, one per line.
+
+    Writes the grade, score and techniques of each grid, and a count of each
+    grade to stderr.
+    """
+
+    files = [open(name) for name in (argv or [])] or [sys.stdin]
+    grades = {}
+    for grid in solve_grids.read_grids(files):
+        try:
+            rating = rate(grid)
+        except (ContradictionError, ValueError) as e:
+            sys.stdout.write('error: %s\n' % e)
+            continue
+        grades[rating.grade] = grades.get(rating.grade, 0) + 1
+        sys.stdout.write('%s %d %s\n' % (
+                rating.grade, rating.score,
+                ','.join('%s=%d' % item
+                         for item in sorted(rating.techniques.items()))))
+    sys.stderr.write('%s\n' % ', '.join(
+            '%s: %d' % (grade, grades.get(grade, 0)) for _, grade in GRADES))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -15,49 +15,47 @@
 """Solves a Sudoku puzzle.
 
 Code modified from the following sources:
-- http://goo.gl/U4hMDV, using http://norvig.com/sudoku.py
+- http://goo.gl/U4hMDV, which originally used http://norvig.com/sudoku.py
+
+The constraint propagation and search are done by the sudoku_core package,
+whose unit and peer tables are built once, at import.
 """
 
 import logging
 
-import norvig_sudoku
+import sudoku_core
+
+
+# Raised when a puzzle cannot be solved.
+ContradictionError = sudoku_core.ContradictionError
+# Raised when a solve runs out of its search budget.
+BudgetExceeded = sudoku_core.BudgetExceeded
+
 
 class SudokuSolver(object):
     """Solves a Sudoku puzzle.
 
+    The solver holds no per-puzzle state, so one instance can be shared by any
+    number of puzzles and threads.
+
     Attributes:
-        digits: String of digits from 1 to 9.
-        rows: String of letters from A to I.
-        cols: String of digits from 1 to 9.
-        squares: String representing the cross product of rows and cols.
-        unitlist: List of list of strings representing all parts of the
-              Sudoku puzzle that go from 1 to 9 (i.e., the top row and the
-              top left box).
-        units: Dictionary of each box mapped to a each list in the unitlist
-              that the box belongs to.
-        peers: Dictionary mapping each box mapped to a set of all other
-              boxes it effects.
+        max_nodes: Most search nodes visited per puzzle, or None.
+        max_seconds: Most seconds spent searching per puzzle, or None.
     """
 
-    def __init__(self):
-        """Initialize the SudokuSolver object and attributes."""
-
-        self.digits = '123456789'
-        self.rows = 'ABCDEFGHI'
-        self.cols = self.digits
-        self.squares = self._cross(self.rows, self.cols)
-        self.unitlist = (
-                [self._cross(self.rows, c) for c in self.cols] +
-                [self._cross(r, self.cols) for r in self.rows] +
-                [self._cross(rs, cs) for rs in (
-                        'ABC', 'DEF', 'GHI') for cs in ('123', '456', '789')])
-        self.units = dict(
-                (s, [u for u in self.unitlist if s in u]) for s in self.squares)
-        self.peers = dict(
-                (s, set(sum(self.units[s], []))-set([s])) for s in self.squares)
+    def __init__(self, max_nodes=None, max_seconds=None):
+        """Initialize the SudokuSolver with an optional search budget."""
+
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+        self._searcher = sudoku_core.Searcher(max_nodes=max_nodes,
+                                              max_seconds=max_seconds)
 
     def solve(self, grid):
-        """Solve the sudoku puzzle, using Peter Norvig's solver script (http://norvig.com/sudoku.py)
+        """Solve the sudoku puzzle, by constraint propagation and search.
+
+        Puzzles of 16, 256 and 625 cells are solved too, by the sized engine;
+        see sudoku_core.sized for how their grids are written.
 
         Args:
             grid: String Sudoku puzzle with all numbers in a row and blanks
@@ -68,33 +66,42 @@ class SudokuSolver(object):
 
         Raises:
             ContradictionError: if puzzle cannot be solved.
+            BudgetExceeded: if the search budget ran out first.
+            ValueError: if the puzzle does not have 16, 81, 256 or 625 cells.
         """
 
-        values = norvig_sudoku.solve(grid)
-        if values and norvig_sudoku.solved(values):
-            logging.info("norvig solver returned: %s", values)
-            keys = values.keys()
-            keys.sort()
-            nstring_answer = ''.join(values[i] for i in keys)
-            logging.info("norvig solver final string: %s", nstring_answer)
-            return nstring_answer
-
-        raise ContradictionError('Puzzle cannot be solved.')
-
-    def _cross(self, a, b):
-        """Cross product of elements in a and elements in b.
+        try:
+            try:
+                solution = self._searcher.solve(grid)
+            except ValueError:
+                # Not a 9x9 grid.
+                from sudoku_core import sized
+                solution = sized.solve(grid, max_nodes=self.max_nodes,
+                                       max_seconds=self.max_seconds)
+        except BudgetExceeded as e:
+            logging.warning("solver gave up on %s: %s", grid, e.stats)
+            raise
+        logging.debug("solver final string: %s", solution)
+        return solution
+
+    def snapshot(self, grid):
+        """Return the propagated candidates and solution of a puzzle.
+
+        Snapshots of recent puzzles are cached, so hints for a puzzle being
+        played are answered without solving it again.
 
         Args:
-            a: A list of strings.
-            b: A list of strings.
+            grid: String Sudoku puzzle with all numbers in a row and blanks
+                set to zero.
 
         Returns:
-            A list of strings representing the cross product of a and b.
-        """
-
-        return [x + y for x in a for y in b]
-
+            A sudoku_core.hints.Snapshot; see its next_hint() method.
 
+        Raises:
+            ContradictionError: if puzzle cannot be solved.
+            BudgetExceeded: if the search budget ran out first.
+            ValueError: if the puzzle does not have 81 cells.
+        """
 
-class ContradictionError(Exception):
-    """Contradiction found in puzzle."""
+        from sudoku_core import hints
+        return hints.SNAPSHOTS.get(grid, self._searcher)
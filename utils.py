@@ -22,6 +22,13 @@ import cloudstorage as gcs
 
 import config
 
+def decode_if_needed(data):
+    if data.startswith('data') and 'base64' in data:
+        # remove data URL prefixes
+        data = data.split('base64,', 1)[1]
+        data = base64.standard_b64decode(data)
+    return data
+
 def create_fname(suffix):
     path = '/'
     filename = path + config.BUCKET_NAME + path + get_uuid() + '.' + suffix
@@ -58,13 +65,17 @@ def create_png_file(image_data):
     gcs_file.close()
     return filename
 
+def read_error_image():
+    """Return the contents of the error message image."""
+    with open("templates/sorry.jpg", "rb") as f:
+        return f.read()
+
 def copy_error_image(filename):
     """Copy an error image to the given GCS-formatted filename.
     """
     try:
         # If we had an error, use an error message image as the response.
-        f = open("templates/sorry.jpg", "rb")
-        image_data = f.read()
+        image_data = read_error_image()
         gcs_file = create_jpg_file(filename, image_data)
         return gcs_file
     except: